@@ -46,6 +46,8 @@ from insar_tools.general import r2_to_r3, reference_r3_ts
 from insar_tools.temporal_baselines import acquisitions_from_ifg_dates, daisy_chain_from_acquisitions, baselines_from_names
 from insar_tools.open_data import open_fabien_cf_data
 
+from volcnet.annotations import read_volcnet_label
+
 
 # MEG debug imports
 sys.path.append("/home/matthew/university_work/python_stuff/python_scripts")
@@ -55,48 +57,6 @@ import matplotlib.pyplot as plt
 
 
 
-def read_volcnet_label(label_file):
-    """Given a .txt file of labels (i.e. deformation or no deformation etc), read it into a dictionary.  
-    Inputs:
-        label_file | pathlib Path | .txt file to open
-    Returns:
-        volcnet_labels
-       
-    History:
-        2022_04_20 | MEG | Modify from similar function in LiCSAlert
-    """
-    import configparser    
-   
-    volcnet_labels = {}
-   
-    config = configparser.ConfigParser()                                                       # read the config file
-    config.read_file(open(label_file))
-    
-    persistent_deformation_events = []
-    transient_deformation_events = []
-    
-    for deformation_event in config.sections():
-        event = {}
-        
-        # first open the parameters that are shared for both persistent and transient deformation
-        list_of_strings = config.get(deformation_event, 'def_polygon').strip('][').split('),')                                      # bit of a horrible string that looks like a list of tuples, convert to list of messy strings
-        event['def_polygon'] = []                                                                                                   # initiate
-        for list_of_string in list_of_strings:                                                                                      # loop through
-            event['def_polygon'].append((float(list_of_string.strip(' ()').split(', ')[0]), float(list_of_string.strip(' ()').split(', ')[1])))       # convert string that looks like tuple to a tuple.  
-        event['def_episode_start'] = int(config.get(deformation_event, 'def_episode_start'))       # 
-        event['def_episode_stop'] = int(config.get(deformation_event, 'def_episode_stop'))       # 
-        event['source'] = config.get(deformation_event, 'source')       # 
-        
-        if deformation_event[:10] == 'persistent':                                                          # then open only persistent event paramters
-            event['def_rate'] = float(config.get(deformation_event, 'def_rate'))       # 
-            persistent_deformation_events.append(event)
-            
-        else:                                                                                               # or transient event parameters.  
-            event['def_magnitude'] = float(config.get(deformation_event, 'def_magnitude'))       # 
-            transient_deformation_events.append(event)
-        
-    return persistent_deformation_events, transient_deformation_events
-
 #############################
 
 
@@ -30,8 +30,9 @@ from datetime import datetime
 
 
 import volcnet
-from volcnet.plotting import volcnet_ts_visualiser, plot_volcnet_files_labels
+from volcnet.plotting import volcnet_ts_visualiser, plot_volcnet_files_labels, render_volcnet_overviews
 from volcnet.labelling import label_volcnet_ifg, label_volcnet_files
+from volcnet.file_handling import open_volcnet_file, convert_volcnet_pickle
 
 
 # sys.path.append("/home/matthew/university_work/23_insar_tools")                  # 
@@ -50,6 +51,7 @@ import matplotlib.pyplot as plt
 
 volcnet_dir = Path("/home/matthew/university_work/13_volcnet")
 volcnet_def_min = 0.05                                                              # in m, less than this is just considered as containing noise.  
+label_index_dir = volcnet_dir / 'label_index'                                       # labels of each file are stored here, so only files whose labels have changed are relabelled.  
 
 figsize = 10
 
@@ -58,6 +60,8 @@ figsize = 10
 
 
 volcnet_files = sorted(glob.glob(str(volcnet_dir / '*.pkl')))            # get the paths to the mat files from fabien
+# volcnet_files = [str(convert_volcnet_pickle(volcnet_file)) for volcnet_file in volcnet_files]           # convert to .volcnet directories (only needs doing once), which are much faster to open and label.  
+# volcnet_files = sorted(glob.glob(str(volcnet_dir / '*.volcnet')))                                       # and use them in future.  
 
 # for volcnet_file in volcnet_files[1:2]:
 #     print("TESTING - only using Campi Flegrei volcnet file.  ")
@@ -69,11 +73,7 @@ for volcnet_file in volcnet_files[11:12]:
     
     
     # 1: Open the file
-    with open(volcnet_file, 'rb') as f:
-        displacement_r3 = pickle.load(f)
-        tbaseline_info = pickle.load(f)
-        persistent_defs = pickle.load(f)
-        transient_defs = pickle.load(f)
+    displacement_r3, tbaseline_info, persistent_defs, transient_defs = open_volcnet_file(volcnet_file)
 
     print(volcnet_file)
     volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, transient_defs, acq_spacing = 1, ifg_resolution = 20, figsize_height = 10,
@@ -81,9 +81,14 @@ for volcnet_file in volcnet_files[11:12]:
     
     
 
+#%% Save the overview of every time series as a .png (without displaying them), only remaking those whose data or labels have changed.  
+
+# render_volcnet_overviews(volcnet_files, volcnet_dir / 'overviews', n_processes = 4, acq_spacing = 1, ifg_resolution = 20, figsize_height = figsize)
+
 #%% Visualise the whole database
 
-labels_dyke, labels_sill, labels_atmo = label_volcnet_files(volcnet_files, def_min = volcnet_def_min)               # label all the VolcNet data - slow! 
+labels_dyke, labels_sill, labels_atmo = label_volcnet_files(volcnet_files, def_min = volcnet_def_min,
+                                                             label_index_dir = label_index_dir)                     # label all the VolcNet data - slow the first time, but then only files that have changed are relabelled.  
 # plot_volcnet_files_labels(volcnet_files, labels_dyke, labels_sill, labels_atmo)                                     # figure with two subplots showing how many of each label etc.  
 
 
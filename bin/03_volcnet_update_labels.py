@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:47:03 2026
+
+@author: matthew
+
+################################################################################################################################
+
+This function updates the labels of the VolcNet files after the annotation .txt files (raw_annotation_data) have been edited.
+
+Only the labels in each file are rewritten, so the time series don't need to be rebuilt with 01_volcnet_constructor.py.  Files
+that are unchanged are left alone, and for the others the episodes that changed (and how many interferograms now have a different
+label) are printed.
+
+################################################################################################################################
+"""
+
+from pathlib import Path
+import pdb
+
+from volcnet.annotations import update_volcnet_labels
+
+
+#%% Settings
+
+volcnet_dir = Path("/home/matthew/university_work/13_volcnet")
+annotation_dir = volcnet_dir / "raw_annotation_data"
+volcnet_def_min = 0.05                                                              # in m, only used to report which interferograms change label.
+volcnet_suffix = '.pkl'                                                             # or '.volcnet' if the files have been converted.
+dry_run = False                                                                     # if True, only report the changes.
+
+# The LiCSBAS time series were renamed when the VolcNet files were made (see 01_volcnet_constructor.py), all others have the same name.
+volcnet_names = {'002A_05136_020502_azores_crop'              : '002A_05136_020502_azores_crop_sao_jorge',
+                 '022D_04826_121209'                          : '022D_04826_121209_campi_flegrei',
+                 '022D_04826_121209_vesuvius_crop'            : '022D_04826_121209_vesuvius',
+                 '082D_05128_030500_azores_crop'              : '082D_05128_030500_azores_sao_jorge',
+                 '083D_12636_131313_domuyo_rationalized_v2'   : '083D_12636_131313_domuyo',
+                 '124D_04854_171313_licsbas_example_extended' : '124D_04854_171313_campi_flegrei',
+                 '169D_00001_020800_rationalized'             : '169D_00001_020800_la_plama'}
+
+
+#%% Update the labels of each file.
+
+n_ifgs_changed = {}                                                                 # number of interferograms whose label changed, for each file that changed.
+for label_file in sorted(annotation_dir.glob('*/*.txt')):
+    volcnet_file = volcnet_dir / (volcnet_names.get(label_file.stem, label_file.stem) + volcnet_suffix)
+    if not volcnet_file.exists():
+        print(f"No VolcNet file for {label_file.name} ({volcnet_file.name}), skipping.  ")
+        continue
+    changes = update_volcnet_labels(volcnet_file, label_file, def_min = volcnet_def_min, dry_run = dry_run)
+    if len(changes['persistent_defs']) + len(changes['transient_defs']) > 0:
+        n_ifgs_changed[volcnet_file.name] = changes['pairs_changed'].shape[0]
+
+
+#%% Summary
+
+print(f"\nThe labels of {len(n_ifgs_changed)} files {'would be' if dry_run else 'were'} updated:  ")
+for volcnet_name, n_ifgs in n_ifgs_changed.items():
+    print(f"    {volcnet_name}: {n_ifgs} interferograms change label.  ")
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:21:14 2026
+
+@author: matthew
+
+Reading the annotation .txt files (raw_annotation_data/*/*.txt) that contain the labels of each time series, and updating the labels
+of VolcNet files when these are edited.
+
+Annotation files are parsed into an episode table, which is a numpy structured array (fields in episode_fields) with one row per
+deformation episode, and a vertices array (n_vertices_total x 2, lon lat) that holds the polygons of all the episodes one after the other.
+Each row of the table points to its polygon with vertex_start and n_vertices.  Many files (e.g. all the annotation directories) can be
+parsed into one table, in which case file_n says which file each episode is from.
+"""
+
+import pdb
+
+volcnet_sources = ['dyke', 'sill']                                          # the source field of an episode table is the index into this
+
+episode_fields = [('file_n',       '<i4'),                                  # number of the annotation file the episode is from
+                  ('section',      '<U32'),                                 # name of the section of the annotation file, e.g. persistent_deformation_00
+                  ('start',        '<i8'),                                  # day number (see volcnet.aux.dates_to_day_numbers)
+                  ('stop',         '<i8'),
+                  ('persistent',   '?'),
+                  ('value',        '<f8'),                                  # rate (m/yr) for persistent episodes, magnitude (m) for transient episodes
+                  ('source',       'u1'),                                   # index into volcnet_sources
+                  ('vertex_start', '<i8'),                                  # the polygon is vertices[vertex_start : vertex_start + n_vertices]
+                  ('n_vertices',   '<i8')]
+
+annotation_cache = {}                                                       # parsed annotation files, keyed by path, with the size and modification time when parsed
+
+#%%
+
+def read_volcnet_label(label_file):
+    """Given a .txt file of labels (i.e. deformation or no deformation etc), read it into a dictionary.
+    Inputs:
+        label_file | pathlib Path | .txt file to open
+    Returns:
+        persistent_defs | list of dicts | Info on each type of persistent deformation in the time series.
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.
+
+    History:
+        2022_04_20 | MEG | Modify from similar function in LiCSAlert
+        2026_10_18 | MEG | Move to volcnet package from 01_volcnet_constructor.py
+        2026_10_18 | MEG | Use parse_annotation_file, and print any problems found by validate_annotations.
+    """
+    episodes, vertices = parse_annotation_file(label_file)
+    for problem in validate_annotations(episodes, vertices, [label_file]):
+        print(f"Warning: {problem}")
+    return episodes_to_defs(episodes, vertices)
+
+
+#%%
+
+def parse_annotation_file(label_file):
+    """ Parse an annotation .txt file into an episode table.  The polygons are parsed with ast.literal_eval, and files in the old bounding box
+    form (def_lon_west, def_lon_east, def_lat_south, def_lat_north) are converted to closed polygons.  The result is cached, so a file
+    is only parsed again if it changes.
+
+    Inputs:
+        label_file | string or pathlib Path | .txt file to open
+    Returns:
+        episodes | structured array | one row per episode, with the fields in episode_fields.  file_n is 0.
+        vertices | n_vertices_total x 2 | lon lat of the vertices of every polygon.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import ast
+    import configparser
+    import numpy as np
+    from pathlib import Path
+    from volcnet.aux import dates_to_day_numbers
+
+    label_file = Path(label_file)
+    file_key = str(label_file.resolve())
+    file_stat = label_file.stat()
+    file_stat = (file_stat.st_size, file_stat.st_mtime_ns)
+    if (file_key in annotation_cache) and (annotation_cache[file_key][0] == file_stat):
+        episodes, vertices = annotation_cache[file_key][1]
+        return episodes.copy(), vertices.copy()                                                             # copies so the cache can't be modified by the caller
+
+    config = configparser.ConfigParser()
+    with open(label_file) as f:
+        config.read_file(f)
+
+    episodes = np.zeros(len(config.sections()), dtype = episode_fields)
+    polygons = []
+    for episode_n, section in enumerate(config.sections()):
+        try:
+            if config.has_option(section, 'def_polygon'):
+                polygon = ast.literal_eval(config.get(section, 'def_polygon'))                                # a list of tuples, written as python
+            else:                                                                                           # old bounding box form, clockwise from the north west corner.
+                west, east, south, north = [config.getfloat(section, key) for key in ['def_lon_west', 'def_lon_east', 'def_lat_south', 'def_lat_north']]
+                polygon = [(west, north), (east, north), (east, south), (west, south), (west, north)]
+            polygon = np.array(polygon, dtype = float).reshape(-1, 2)
+            episodes[episode_n]['section'] = section
+            episodes[episode_n]['start'], episodes[episode_n]['stop'] = dates_to_day_numbers([config.get(section, 'def_episode_start'),
+                                                                                              config.get(section, 'def_episode_stop')])
+            episodes[episode_n]['persistent'] = section[:10] == 'persistent'
+            episodes[episode_n]['value'] = config.getfloat(section, 'def_rate' if section[:10] == 'persistent' else 'def_magnitude')
+            source = config.get(section, 'source')
+            if source not in volcnet_sources:
+                raise Exception(f"source must be one of {volcnet_sources}, not '{source}'.  ")
+            episodes[episode_n]['source'] = volcnet_sources.index(source)
+        except Exception as error:
+            raise Exception(f"Unable to parse section [{section}] of {label_file}: {error}") from error
+        polygons.append(polygon)
+
+    n_vertices = np.array([polygon.shape[0] for polygon in polygons], dtype = np.int64)
+    episodes['n_vertices'] = n_vertices
+    episodes['vertex_start'] = np.cumsum(n_vertices) - n_vertices
+    vertices = np.concatenate(polygons + [np.zeros((0, 2))], axis = 0)
+
+    annotation_cache[file_key] = (file_stat, (episodes, vertices))
+    return episodes.copy(), vertices.copy()
+
+
+#%%
+
+def read_annotation_dirs(annotation_dirs):
+    """ Parse all the annotation .txt files in some directories into one episode table.
+
+    Inputs:
+        annotation_dirs | list of strings or pathlib Paths | e.g. the directories in raw_annotation_data
+    Returns:
+        label_files | list of pathlib Paths | the annotation files, in the order of file_n.
+        episodes | structured array | one row per episode, see episode_fields.
+        vertices | n_vertices_total x 2 | lon lat of the vertices of every polygon.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    from pathlib import Path
+
+    label_files = []
+    for annotation_dir in annotation_dirs:
+        label_files.extend(sorted(Path(annotation_dir).glob('*.txt')))
+
+    episodes_all = [np.zeros(0, dtype = episode_fields)]
+    vertices_all = [np.zeros((0, 2))]
+    n_vertices_total = 0
+    for file_n, label_file in enumerate(label_files):
+        episodes, vertices = parse_annotation_file(label_file)
+        episodes['file_n'] = file_n
+        episodes['vertex_start'] += n_vertices_total                                                        # as the polygons of all the files are in one array
+        n_vertices_total += vertices.shape[0]
+        episodes_all.append(episodes)
+        vertices_all.append(vertices)
+
+    return label_files, np.concatenate(episodes_all), np.concatenate(vertices_all, axis = 0)
+
+
+#%%
+
+def validate_annotations(episodes, vertices, label_files = None):
+    """ Check an episode table for problems:
+        - episodes that stop before (or when) they start.
+        - polygons that aren't closed (i.e. the last vertex isn't the first) or have fewer than 4 vertices.
+        - episodes of the same type (persistent or transient) in the same file that overlap in time, and whose polygons overlap.
+          (i.e. the deformation at some place and time is counted twice)
+
+    Inputs:
+        episodes | structured array | e.g. output of parse_annotation_file or read_annotation_dirs
+        vertices | n_vertices_total x 2 |
+        label_files | list or None | names of the files, for the messages.
+    Returns:
+        problems | list of strings | one for each problem found.  Empty if there aren't any.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    from volcnet.aux import day_numbers_to_dates
+
+    def episode_name(episode):
+        file_name = str(label_files[episode['file_n']]).split('/')[-1] if label_files is not None else f"file {episode['file_n']}"
+        return f"{file_name} [{episode['section']}]"
+
+    problems = []
+    starts = day_numbers_to_dates(episodes['start'])
+    stops = day_numbers_to_dates(episodes['stop'])
+
+    # 1: reversed dates
+    for episode_n in np.flatnonzero(episodes['stop'] <= episodes['start']):
+        problems.append(f"{episode_name(episodes[episode_n])} stops ({stops[episode_n]}) before or when it starts ({starts[episode_n]}).  ")
+
+    # 2: open polygons
+    first_vertices = vertices[episodes['vertex_start']] if vertices.shape[0] > 0 else np.zeros((episodes.shape[0], 2))
+    last_vertices = vertices[episodes['vertex_start'] + episodes['n_vertices'] - 1] if vertices.shape[0] > 0 else np.zeros((episodes.shape[0], 2))
+    open_polygons = (episodes['n_vertices'] < 4) | np.any(first_vertices != last_vertices, axis = 1)
+    for episode_n in np.flatnonzero(open_polygons):
+        problems.append(f"{episode_name(episodes[episode_n])} has a polygon that isn't closed (or has fewer than 4 vertices).  ")
+
+    # 3: overlapping episodes, in time and space (using the bounding box of each polygon)
+    bboxes = np.zeros((episodes.shape[0], 4))                                                               # lon min, lat min, lon max, lat max
+    for episode_n, episode in enumerate(episodes):
+        polygon = vertices[episode['vertex_start'] : episode['vertex_start'] + episode['n_vertices']]
+        if polygon.shape[0] > 0:
+            bboxes[episode_n] = np.concatenate([np.min(polygon, axis = 0), np.max(polygon, axis = 0)])
+    same_group = ((episodes['file_n'][:, np.newaxis] == episodes['file_n'][np.newaxis, :]) &
+                  (episodes['persistent'][:, np.newaxis] == episodes['persistent'][np.newaxis, :]))
+    overlap_time = ((episodes['start'][:, np.newaxis] < episodes['stop'][np.newaxis, :]) &
+                    (episodes['start'][np.newaxis, :] < episodes['stop'][:, np.newaxis]))
+    overlap_space = ((bboxes[:, np.newaxis, 0] < bboxes[np.newaxis, :, 2]) & (bboxes[np.newaxis, :, 0] < bboxes[:, np.newaxis, 2]) &
+                     (bboxes[:, np.newaxis, 1] < bboxes[np.newaxis, :, 3]) & (bboxes[np.newaxis, :, 1] < bboxes[:, np.newaxis, 3]))
+    for episode_n1, episode_n2 in zip(*np.nonzero(np.triu(same_group & overlap_time & overlap_space, k = 1))):        # each pair only once
+        problems.append(f"{episode_name(episodes[episode_n1])} ({starts[episode_n1]}-{stops[episode_n1]}) overlaps with [{episodes[episode_n2]['section']}] "
+                        f"({starts[episode_n2]}-{stops[episode_n2]}).  ")
+
+    return problems
+
+
+#%%
+
+def episodes_to_defs(episodes, vertices):
+    """ Convert an episode table (of one file) to the lists of dicts used in the VolcNet files.
+
+    Inputs:
+        episodes | structured array | e.g. output of parse_annotation_file
+        vertices | n_vertices_total x 2 |
+    Returns:
+        persistent_defs | list of dicts | Info on each type of persistent deformation in the time series.
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    from volcnet.aux import day_numbers_to_dates
+
+    starts = day_numbers_to_dates(episodes['start'])
+    stops = day_numbers_to_dates(episodes['stop'])
+
+    persistent_defs = []
+    transient_defs = []
+    for episode_n, episode in enumerate(episodes):
+        polygon = vertices[episode['vertex_start'] : episode['vertex_start'] + episode['n_vertices']]
+        deformation = {'def_polygon'       : [(float(lon), float(lat)) for lon, lat in polygon],
+                       'def_episode_start' : int(starts[episode_n]),
+                       'def_episode_stop'  : int(stops[episode_n]),
+                       'source'            : volcnet_sources[episode['source']]}
+        if episode['persistent']:
+            deformation['def_rate'] = float(episode['value'])
+            persistent_defs.append(deformation)
+        else:
+            deformation['def_magnitude'] = float(episode['value'])
+            transient_defs.append(deformation)
+    return persistent_defs, transient_defs
+
+
+#%%
+
+class Episodes():
+    """ A compact container for the deformation episodes (labels) of one time series, which can be used instead of persistent_defs and
+    transient_defs (lists of dicts) by the labelling, plotting and interferogram making functions.  It holds an episode table (see
+    episode_fields) and the vertices of all the polygons in one array, so there are no dicts and lists of tuples to look things up in.
+
+    Usage:
+        episodes = Episodes.from_defs(persistent_defs, transient_defs)              # or Episodes.from_annotation_file(label_file)
+        episodes.starts, episodes.values, episodes.polygon(0) etc.
+        persistent_defs, transient_defs = episodes.to_defs()
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    __slots__ = ('table', 'vertices')
+
+    def __init__(self, table, vertices):
+        """
+        Inputs:
+            table | structured array | one row per episode, with the fields in episode_fields.
+            vertices | n_vertices_total x 2 | lon lat of the vertices of every polygon.
+        """
+        self.table = table
+        self.vertices = vertices
+
+    @classmethod
+    def from_defs(cls, persistent_defs, transient_defs):
+        """ Make from the lists of dicts used in the VolcNet files.  Persistent episodes are first, then transient.
+        Raises an Exception if the source of an episode isn't one of volcnet_sources, as the episode table stores the source as an index into it.
+        """
+        import numpy as np
+        from volcnet.aux import dates_to_day_numbers
+
+        defs = list(persistent_defs) + list(transient_defs)
+        table = np.zeros(len(defs), dtype = episode_fields)
+        table['section'] = ([f"persistent_deformation_{def_n:02d}" for def_n in range(len(persistent_defs))] +
+                            [f"transient_deformation_{def_n:02d}" for def_n in range(len(transient_defs))])
+        table['start'] = dates_to_day_numbers([deformation['def_episode_start'] for deformation in defs])
+        table['stop'] = dates_to_day_numbers([deformation['def_episode_stop'] for deformation in defs])
+        table['persistent'] = np.arange(len(defs)) < len(persistent_defs)
+        table['value'] = [deformation['def_rate'] for deformation in persistent_defs] + [deformation['def_magnitude'] for deformation in transient_defs]
+        for section, deformation in zip(table['section'], defs):
+            if deformation['source'] not in volcnet_sources:
+                raise Exception(f"The source of {section} must be one of {volcnet_sources}, not '{deformation['source']}'.  ")
+        table['source'] = [volcnet_sources.index(deformation['source']) for deformation in defs]
+        polygons = [np.array(deformation['def_polygon'], dtype = float).reshape(-1, 2) for deformation in defs]
+        table['n_vertices'] = [polygon.shape[0] for polygon in polygons]
+        table['vertex_start'] = np.cumsum(table['n_vertices']) - table['n_vertices']
+        return cls(table, np.concatenate(polygons + [np.zeros((0, 2))], axis = 0))
+
+    @classmethod
+    def from_labels(cls, persistent_defs, transient_defs = None):
+        """ Make from either the lists of dicts, or an Episodes (which is returned unchanged, and transient_defs is not used).
+        """
+        if isinstance(persistent_defs, cls):
+            return persistent_defs
+        return cls.from_defs(persistent_defs, transient_defs)
+
+    @classmethod
+    def from_annotation_file(cls, label_file):
+        """ Make from an annotation .txt file (see parse_annotation_file).
+        """
+        return cls(*parse_annotation_file(label_file))
+
+    def to_defs(self):
+        """ Convert to the lists of dicts used in the VolcNet files.
+        """
+        return episodes_to_defs(self.table, self.vertices)
+
+    def ordered(self):
+        """ The same episodes, but with the persistent episodes first, then the transient ones (as in the VolcNet files).
+        """
+        import numpy as np
+        return Episodes(self.table[np.argsort(~self.table['persistent'], kind = 'stable')], self.vertices)
+
+    def polygon(self, episode_n):
+        """ The polygon of one episode, as an n_vertices x 2 array (lon lat).
+        """
+        episode = self.table[episode_n]
+        return self.vertices[episode['vertex_start'] : episode['vertex_start'] + episode['n_vertices']]
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    @property
+    def starts(self):
+        """ Day number of the start of each episode. """
+        return self.table['start']
+
+    @property
+    def stops(self):
+        """ Day number of the end of each episode. """
+        return self.table['stop']
+
+    @property
+    def persistent(self):
+        """ True if the episode is persistent, False if transient. """
+        return self.table['persistent']
+
+    @property
+    def values(self):
+        """ Rate (m/yr) of persistent episodes, magnitude (m) of transient episodes. """
+        return self.table['value']
+
+    @property
+    def sources(self):
+        """ Source of each episode, as a list of strings. """
+        return [volcnet_sources[source] for source in self.table['source']]
+
+
+#%%
+
+def update_volcnet_labels(volcnet_file, label_file, def_min = 0.05, dry_run = False):
+    """ Replace the labels of a VolcNet file with those in its annotation .txt file, without reading or rewriting the displacement cube
+    (so the time series doesn't need to be rebuilt with 01_volcnet_constructor.py each time an annotation is edited).
+    Reports which deformation episodes changed, and which interferograms (pairs of acquisitions) have a different label as a result.
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        label_file | string or pathlib Path | annotation .txt file
+        def_min | float | magnitude of deformation must be larger than this to be classed as deformation.  Only used to report the changes.  Units: metres.
+        dry_run | boolean | if True, the changes are reported but the VolcNet file is not updated.
+
+    Returns:
+        changes | dict | contains:
+                            persistent_defs | list of (int, string) | number of each persistent episode that was 'added', 'removed' or 'changed'
+                            transient_defs | list of (int, string) | as above, for transient episodes.
+                            pairs_changed | n_changed x 2 | acquisition 1 and acquisition 2 of each interferogram whose label (dyke, sill or atmo)
+                                                             or deformation magnitude changed.  i.e. the rows of labels_dyke etc. that change.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    from pathlib import Path
+
+    from volcnet.file_handling import open_volcnet_labels, write_volcnet_labels, def_to_json
+    from volcnet.labelling import label_volcnet_file_pairs
+
+    volcnet_file = Path(volcnet_file)
+    tbaseline_info, persistent_defs_old, transient_defs_old, _ = open_volcnet_labels(volcnet_file)
+    persistent_defs, transient_defs = read_volcnet_label(label_file)
+
+    # 1: which episodes changed
+    changes = {}
+    for def_type, defs_old, defs in zip(('persistent_defs', 'transient_defs'), (persistent_defs_old, transient_defs_old), (persistent_defs, transient_defs)):
+        changes[def_type] = []
+        for def_n in range(max(len(defs_old), len(defs))):
+            if def_n >= len(defs_old):
+                changes[def_type].append((def_n, 'added'))
+            elif def_n >= len(defs):
+                changes[def_type].append((def_n, 'removed'))
+            elif def_to_json(defs_old[def_n]) != def_to_json(defs[def_n]):                                        # compare the JSON forms, so numpy and python types are the same.
+                changes[def_type].append((def_n, 'changed'))
+
+    # 2: which interferograms have a different label.
+    n_acq = len(tbaseline_info['acq_dates'])
+    label_matrices = []
+    for defs_p, defs_t in zip((persistent_defs_old, persistent_defs), (transient_defs_old, transient_defs)):
+        file_labels = label_volcnet_file_pairs(tbaseline_info, defs_p, defs_t, def_min)
+        label_types = np.full((n_acq, n_acq), -1)                                                                     # -1 for ifgs between the same date, which aren't labelled.
+        label_types[file_labels['acq_n1s'], file_labels['acq_n2s']] = file_labels['label_types']
+        def_predicted = np.zeros((n_acq, n_acq))
+        def_predicted[file_labels['acq_n1s'], file_labels['acq_n2s']] = file_labels['def_predicted']
+        label_matrices.append((label_types, def_predicted))
+    pairs_changed = (label_matrices[0][0] != label_matrices[1][0]) | (label_matrices[0][1] != label_matrices[1][1])
+    changes['pairs_changed'] = np.argwhere(pairs_changed)
+
+    # 3: report, and update the file.
+    print(f"{volcnet_file.name}: ", end = '')
+    n_episodes_changed = len(changes['persistent_defs']) + len(changes['transient_defs'])
+    if n_episodes_changed == 0:
+        print("labels are unchanged.  ")
+        return changes
+    print(f"{n_episodes_changed} episodes changed, which changes the label of {changes['pairs_changed'].shape[0]} of {n_acq * (n_acq - 1)} interferograms.  ")
+    for def_type in ['persistent_defs', 'transient_defs']:
+        for def_n, change in changes[def_type]:
+            print(f"    {def_type[:-5]} deformation {def_n:02d}: {change}")
+    if not dry_run:
+        write_volcnet_labels(volcnet_file, persistent_defs, transient_defs)
+    return changes
+
+
+#%%
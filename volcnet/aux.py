@@ -20,27 +20,135 @@ def ll_2_pixel(lls, lons, lats):
         lats | rank 2 array | lats for each pixel
         
     Returns:
-        xys_array | ? x 2 | x and y pixel number (as floats) for each coordinate paire
+        xys_array | ? x 2 | x and y pixel number (as ints) for each coordinate paire
         
     History:
         2022_05_10 | MEG | Written.  
+        2026_10_18 | MEG | Use GeoTransform, so vectorised and rounds to the nearest pixel (rather than truncating).  
     """
     
-    import numpy as np
+    return GeoTransform.from_lonlats(lons, lats).ll_to_pixel(lls)
+
+
+#%%
+
+class GeoTransform():
+    """ The affine transform between pixel numbers (x, y, in matrix notation so 0,0 is top left) and lon lat for a regular grid.  
+    Make it once for a time series with GeoTransform.from_lonlats(lons, lats), then convert any number of points in one go.  
+        lon = lon_0 + x * lon_dx + y * lon_dy
+        lat = lat_0 + x * lat_dx + y * lat_dy
+    For a normal north up grid, lon_dy and lat_dx are 0, and lat_dy is negative.  
     
-    xys = np.zeros((len(lls), 2), dtype = 'int')
+    History:
+        2026_10_18 | MEG | Written.  
+    """
     
-    ll_upper_left = np.array([lons[0,0], lats[0,0]])                                  # x then y, lon then lat
+    def __init__(self, lon_0, lat_0, lon_dx, lon_dy, lat_dx, lat_dy):
+        """
+        Inputs:
+            lon_0 | float | lon of the centre of pixel 0,0
+            lat_0 | float | lat of the centre of pixel 0,0
+            lon_dx | float | change in lon for one pixel in x.  
+            lon_dy | float | change in lon for one pixel in y.  
+            lat_dx | float | change in lat for one pixel in x.  
+            lat_dy | float | change in lat for one pixel in y.  
+        """
+        import numpy as np
+        
+        self.origin = np.array([lon_0, lat_0])
+        self.matrix = np.array([[lon_dx, lon_dy],                                                 # pixel to lon lat
+                                [lat_dx, lat_dy]])
+        self.matrix_inverse = np.linalg.inv(self.matrix)                                            # lon lat to pixel
+        
+    @classmethod
+    def from_lonlats(cls, lons, lats):
+        """ Make the transform from the lons and lats of each pixel.  
+        Inputs:
+            lons | rank 2 array | lons for each pixel
+            lats | rank 2 array | lats for each pixel
+        """
+        ny, nx = lons.shape
+        if (ny < 2) or (nx < 2):
+            raise Exception(f"The lons and lats must be at least 2 x 2 to work out the pixel size, but are {ny} x {nx}.  Exiting.  ")
+        lon_dx = (lons[0, -1] - lons[0, 0]) / (nx - 1)                                                # average over the whole row/column, rather than just from the first two pixels
+        lon_dy = (lons[-1, 0] - lons[0, 0]) / (ny - 1)
+        lat_dx = (lats[0, -1] - lats[0, 0]) / (nx - 1)
+        lat_dy = (lats[-1, 0] - lats[0, 0]) / (ny - 1)
+        return cls(lons[0, 0], lats[0, 0], lon_dx, lon_dy, lat_dx, lat_dy)
     
-    pixel_size = {}
-    pixel_size['x'] = np.abs(lons[0,0] - lons[0,1])                                 # how many degrees between each pixel, in x
-    pixel_size['y'] = np.abs(lats[0,0] - lats[1,0])
+    def ll_to_pixel(self, lls, rounding = True):
+        """ Convert lon lats to pixel numbers.  
+        Inputs:
+            lls | ? x 2 array or list of tuples | lon lat pairs
+            rounding | boolean | if True, round to the nearest pixel and return ints, if False return (fractional) floats.  
+        Returns:
+            xys | ? x 2 | x and y pixel numbers.  
+        """
+        import numpy as np
+        
+        lls = np.asarray(lls, dtype = float).reshape(-1, 2)
+        xys = (lls - self.origin) @ self.matrix_inverse.T
+        if rounding:
+            xys = np.rint(xys).astype(int)
+        return xys
+        
+    def pixel_to_ll(self, xys):
+        """ Convert pixel numbers (which can be fractional) to lon lats.  
+        Inputs:
+            xys | ? x 2 array or list of tuples | x and y pixel numbers
+        Returns:
+            lls | ? x 2 | lon lat pairs
+        """
+        import numpy as np
+        
+        xys = np.asarray(xys, dtype = float).reshape(-1, 2)
+        return self.origin + xys @ self.matrix.T
+
+
+#%%
+
+def dates_to_day_numbers(dates):
+    """ Given a list of dates in the form yyyymmdd (as either strings or ints), convert them to integer day numbers (days since 1970/01/01).  
+    Differences between day numbers are the same as the .days of the difference between the equivalent datetimes, but can be computed for 
+    many dates at once.  
     
-    for point_n, ll in enumerate(lls):
-        xys[point_n, 0] = int((ll[0] - ll_upper_left[0])   / pixel_size['x'])
-        xys[point_n, 1] = int(((-1) * (ll[1] - ll_upper_left[1]))   / pixel_size['y'])         # y needs flipping as down is positive in matrix notation
+    Inputs:
+        dates | list of strings or ints | dates in form yyyymmdd
+        
+    Returns:
+        day_numbers | rank 1 array of ints | day number for each date.  
         
-    return xys
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    
+    dates_iso = [f"{str(date)[:4]}-{str(date)[4:6]}-{str(date)[6:8]}" for date in dates]                 # numpy datetime64 needs yyyy-mm-dd
+    day_numbers = np.array(dates_iso, dtype = 'datetime64[D]').astype(np.int64)                          # days since the unix epoch
+    return day_numbers
+
+
+#%%
+
+def day_numbers_to_dates(day_numbers):
+    """ The inverse of dates_to_day_numbers.  
+    
+    Inputs:
+        day_numbers | rank 1 array of ints | days since 1970/01/01
+        
+    Returns:
+        dates | rank 1 array of ints | dates in form yyyymmdd
+        
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    
+    days = np.asarray(day_numbers, dtype = np.int64).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    dates = (years * 10000) + ((months.astype(np.int64) % 12 + 1) * 100) + ((days - months).astype(np.int64) + 1)      # yyyy, mm and dd
+    return dates
 
 
-#%%
\ No newline at end of file
+#%%
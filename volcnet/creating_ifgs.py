@@ -7,125 +7,351 @@ Created on Wed Oct  5 15:00:52 2022
 """
 
 
-def create_volcnet_ifgs(labels_all, volcnet_files, outdir, n_data_per_file = 100, ny = 224, nx = 224, volcnet_def_min = 0.05):
+def create_volcnet_ifgs(labels_all, volcnet_files, outdir, n_data_per_file = 100, ny = 224, nx = 224, volcnet_def_min = 0.05,
+                        outfile_stem = 'data_file_unshuffled', random_seed = None, n_ifgs_per_block = 50, shard_format = 'pkl', fill_value = 0.):
     """ Given the file numbers, acquisition 1 and acqustion 2 numbers in labels all, and the volcnet files, make those interferograms.  
     Inputs:
         labels_all | many x 4 |  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
-        volcnet_files | list of strings | list of volcnet files to label.  
+        volcnet_files | list of strings | list of volcnet files to label.  Either .pkl files or .volcnet directories.
         def_min | float | magnitude of deformation must be larger than this to be classed as deformation.  Units: metres.  
         outdir | pathlib Path |  out directory.  
         n_data_per_file | int | number of data per .pkl file
         ny | int | output size, in pixels
         nx | int | as above. 
         volcnet_def_min | float | deformation must be above this (in metres) be classed as deformation.  
-        
+        outfile_stem | string | the .pkl files are named <outfile_stem>_00000.pkl etc.
+        random_seed | int or None | if not None, numpy's (and python's) random number generators are seeded with this, so the random crops are reproducible.
+        n_ifgs_per_block | int | number of ifgs that are made (and cropped) at once.  Larger is faster, but uses more memory.  
+        shard_format | string | 'pkl' (masked arrays, as before) or 'npy' (float32 X, packed mask and compact labels).  See volcnet.shards
+        fill_value | float | value of masked pixels in X for the npy format.
+
     Returns:
-        .pkl files with X, Y_class, Y_loc
-        
+        .pkl (or .npy) files with X, Y_class, Y_loc.  Every file has n_data_per_file data, except the last which has the remainder.
+        <outfile_stem>_manifest.json | the number of data in each .pkl file.
+        manifest | dict | contents of the manifest.
+
     History:
         2022_10_05 | MEG | written.  
-        
+        2026_10_18 | MEG | Label using a label model that is compiled once per file.
+        2026_10_18 | MEG | Also open .volcnet directories.
+        2026_10_18 | MEG | Opening files and making the crops and labels for each ifg moved to functions shared with volcnet_ifg_generator.
+        2026_10_18 | MEG | Add outfile_stem and random_seed, used by create_volcnet_ifgs_parallel.
+        2026_10_18 | MEG | Make the ifgs in blocks.  
+        2026_10_18 | MEG | Use ShardWriter, so each file has n_data_per_file data (previously n_data_per_file - 1), the final partial file is saved, and no crops are dropped.
+        2026_10_18 | MEG | Add the npy shard format.
+
     """
     import numpy as np
-    import numpy.ma as ma
-    import pickle
-    
+    import random
 
-    from volcnet.labelling import label_volcnet_ifg
-    from volcnet.aux import ll_2_pixel
-    
-    from deep_learning_tools.data_handling import rescale_timeseries, random_cropping
+    from volcnet.shards import ShardWriter
+
+    if random_seed is not None:
+        np.random.seed(random_seed)
+        random.seed(random_seed)
+
+    shard_writer = ShardWriter(outdir, outfile_stem, n_data_per_file, shard_format, fill_value)
+    current_file = None
+
+    for file_n_block, labels_block in labels_blocks(labels_all, n_ifgs_per_block):
+
+        # 0: open the volcnet file (if not already open)
+        if current_file != file_n_block:
+            current_file = file_n_block
+            displacement_r3, pixel_labels = open_volcnet_file_for_ifgs(volcnet_files[current_file], ny, nx)
+
+        # 1: make the block of ifgs, and crop and label them.
+        X_crops, Y_class_crops, Y_loc_crops = ifgs_crops_and_labels(labels_block, displacement_r3, pixel_labels, ny, volcnet_def_min)
+
+        # 2: add them to the shards, which are saved each time n_data_per_file have been made.
+        shard_writer.add(X_crops, Y_class_crops, Y_loc_crops)
+
+    manifest = shard_writer.close()                                                                  # save the final partial shard and the manifest
+    return manifest
+
+
+#%%
+
+def create_volcnet_ifgs_parallel(labels_all, volcnet_files, outdir, n_processes = 4, n_ifgs_per_task = 2000, n_data_per_file = 100,
+                                 ny = 224, nx = 224, volcnet_def_min = 0.05, random_seed = 0, n_ifgs_per_block = 50, shard_format = 'pkl', fill_value = 0.):
+    """ As create_volcnet_ifgs, but the work is split across a pool of processes.  The rows of labels_all are split by volcnet file, and then
+    into chunks of n_ifgs_per_task rows, and each chunk is made by create_volcnet_ifgs in a separate process.  Each process opens the volcnet
+    file itself, and .volcnet directories are memory mapped (read only) so processes working on the same file share it through the page cache.  
     
-    def initialise_arrays(n_data, ny, nx,n_channels):
-        """
-        """
-        X = ma.zeros((n_data, ny, nx, n_channels))               # initialise, rank 4 ready for Tensorflow, last dimension is being used for different crops.  
-        Y_class = np.zeros((n_data, 3))                                                                             # initialise, doesn't need another dim as label is the same regardless of the crop.  
-        Y_loc = np.zeros((n_data, 4))                                                                            # initialise
-        return X, Y_class, Y_loc
+    The output files are named by the volcnet file and chunk they came from, e.g. data_file_unshuffled_007_0003_00012.pkl is the 12th .pkl file
+    made from the 3rd chunk of volcnet file 7, so the names (and contents) don't depend on the number of processes or the order they finish in.  
+    Each chunk's random crops are seeded from random_seed, the file number and the chunk number, so the outputs are reproducible.  
     
-    file_n = 0
-    data_n = 0
-    X, Y_class, Y_loc = initialise_arrays(n_data_per_file, ny, nx, 1)                # initiliase for next file.      
+    As each chunk is written by its own ShardWriter, the last file of every chunk is usually partial (i.e. it has fewer than n_data_per_file 
+    data), so there can be one partial file per chunk rather than one in total.  The manifest records how many data are in each file.  
+    The manifest each chunk writes (e.g. data_file_unshuffled_007_0003_manifest.json) is deleted once they have been combined.  
     
-    for ifg_n, ifg_info in enumerate(labels_all):
+    Inputs:
+        labels_all | many x 4 |  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
+        volcnet_files | list of strings | list of volcnet files.  Either .pkl files or .volcnet directories.
+        outdir | pathlib Path |  out directory.
+        n_processes | int | number of processes to use.
+        n_ifgs_per_task | int | maximum number of rows of labels_all (i.e. ifgs) each process is given at a time.  
+        n_data_per_file | int | number of data per .pkl file
+        ny | int | output size, in pixels
+        nx | int | as above.
+        volcnet_def_min | float | deformation must be above this (in metres) be classed as deformation.
+        random_seed | int | used to make the seed for each chunk.  
+        n_ifgs_per_block | int | number of ifgs that each process makes (and crops) at once.  See create_volcnet_ifgs.
+        shard_format | string | 'pkl' or 'npy'.  See create_volcnet_ifgs.
+        fill_value | float | value of masked pixels in X for the npy format.
         
-        # 0: open the volcnet file and check not already open)
-        if ifg_n == 0:
-            current_file = int(ifg_info[0])
-            open_volcnet_file = True
+    Returns:
+        .pkl files with X, Y_class, Y_loc.  The last file from each chunk usually has fewer than n_data_per_file data.  
+        data_file_unshuffled_manifest.json | the number of data in each .pkl file, for all the chunks.
+        manifest | dict | contents of the manifest.
+        
+    History:
+        2026_10_18 | MEG | Written.
+        2026_10_18 | MEG | Delete the manifests of each chunk once they have been combined.  
+        2026_10_18 | MEG | Add n_ifgs_per_block.  
+    """
+    import numpy as np
+    import multiprocessing
+    from pathlib import Path
+    
+    from volcnet.shards import write_manifest
+    
+    # 1: split the rows into tasks, first by file, then into chunks.  
+    tasks = []
+    for file_n in np.unique(labels_all[:, 0]).astype(int):
+        labels_file = labels_all[labels_all[:, 0] == file_n]                                                     # keeps the order of the rows within each file
+        for chunk_n, chunk_start in enumerate(range(0, labels_file.shape[0], n_ifgs_per_task)):
+            chunk_seed = int(np.random.SeedSequence([random_seed, file_n, chunk_n]).generate_state(1)[0])       # depends only on the chunk, not on the process it runs in
+            tasks.append((labels_file[chunk_start : chunk_start + n_ifgs_per_task], volcnet_files, outdir, n_data_per_file, ny, nx, volcnet_def_min,
+                          f"data_file_unshuffled_{file_n:03d}_{chunk_n:04d}", chunk_seed, n_ifgs_per_block, shard_format, fill_value))
     
+    # 2: and make them.  
+    print(f"Making the interferograms in {len(tasks)} chunks with {n_processes} processes.  ")
+    with multiprocessing.Pool(n_processes) as pool:
+        chunk_manifests = pool.starmap(create_volcnet_ifgs, tasks, chunksize = 1)                          # in the same order as tasks, regardless of the order they finish in
+    
+    # 3: combine the manifests from each chunk into one, then delete the manifests of each chunk.  
+    shards = [shard for chunk_manifest in chunk_manifests for shard in chunk_manifest['shards']]
+    X_shapes = [chunk_manifest['X_shape'] for chunk_manifest in chunk_manifests if chunk_manifest['X_shape'] is not None]
+    manifest = write_manifest(outdir, 'data_file_unshuffled', n_data_per_file, shards, shard_format, fill_value, X_shapes[0] if len(X_shapes) > 0 else None)
+    for task in tasks:
+        (Path(outdir) / f"{task[7]}_manifest.json").unlink(missing_ok = True)                              # task[7] is the chunk's outfile_stem
+    return manifest
+    
+
+#%%
+
+def volcnet_ifg_generator(labels_all, volcnet_files, batch_size = 32, ny = 224, nx = 224, volcnet_def_min = 0.05, n_ifgs_per_block = 50):
+    """ Given the file numbers, acquisition 1 and acqustion 2 numbers in labels all, and the volcnet files, make those interferograms and yield
+    them in batches.  Nothing is written to disk, and only one volcnet file and one batch are held in memory at a time.
+    Each ifg produces 9 random crops (as in create_volcnet_ifgs), so a batch can contain crops from more than one ifg.
+
+    Inputs:
+        labels_all | many x 4 |  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
+        volcnet_files | list of strings | list of volcnet files.  Either .pkl files or .volcnet directories.
+        batch_size | int | number of data in each batch.  The final batch may be smaller.
+        ny | int | output size, in pixels
+        nx | int | as above. 
+        volcnet_def_min | float | deformation must be above this (in metres) be classed as deformation.  
+        n_ifgs_per_block | int | number of ifgs that are made (and cropped) at once.  
+
+    Returns (yields):
+        X | batch_size x ny x nx x 1 | masked array of interferograms
+        Y_class | batch_size x 3 | one hot encoding of dyke, sill, atmo
+        Y_loc | batch_size x 4 | location of deformation (in pixels).  0s if no deformation.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+
+    data_n = 0
+    X, Y_class, Y_loc = initialise_arrays(batch_size, ny, nx, 1)
+    current_file = None
+
+    for file_n_block, labels_block in labels_blocks(labels_all, n_ifgs_per_block):
+
+        # 0: open the volcnet file (if not already open)
+        if current_file != file_n_block:
+            current_file = file_n_block
+            displacement_r3, pixel_labels = open_volcnet_file_for_ifgs(volcnet_files[current_file], ny, nx)
+
+        # 1: make the block of ifgs, and crop and label them.
+        X_crops, Y_class_crops, Y_loc_crops = ifgs_crops_and_labels(labels_block, displacement_r3, pixel_labels, ny, volcnet_def_min)
+
+        # 2: add the crops to the batch, yielding it each time it fills.
+        crop_n = 0
+        while crop_n < X_crops.shape[0]:
+            n_add = min(X_crops.shape[0] - crop_n, batch_size - data_n)                                     # either the rest of the crops, or as many as will fit in the batch.
+            X[data_n : data_n + n_add] = X_crops[crop_n : crop_n + n_add]
+            Y_class[data_n : data_n + n_add] = Y_class_crops[crop_n : crop_n + n_add]
+            Y_loc[data_n : data_n + n_add] = Y_loc_crops[crop_n : crop_n + n_add]
+            data_n += n_add
+            crop_n += n_add
+            if data_n == batch_size:
+                yield X, Y_class, Y_loc
+                data_n = 0
+                X, Y_class, Y_loc = initialise_arrays(batch_size, ny, nx, 1)                                 # new arrays, as the ones yielded may still be in use.
+
+    if data_n > 0:                                                                                           # final partial batch
+        yield X[:data_n], Y_class[:data_n], Y_loc[:data_n]
+
+
+#%%
+
+def initialise_arrays(n_data, ny, nx, n_channels):
+    """ Initialise the arrays that interferograms and their labels are stored in.
+    """
+    import numpy as np
+    import numpy.ma as ma
+
+    X = ma.zeros((n_data, ny, nx, n_channels))               # initialise, rank 4 ready for Tensorflow, last dimension is being used for different crops.
+    Y_class = np.zeros((n_data, 3))                                                                             # initialise, doesn't need another dim as label is the same regardless of the crop.
+    Y_loc = np.zeros((n_data, 4))                                                                            # initialise
+    return X, Y_class, Y_loc
+
+
+#%%
+
+def open_volcnet_file_for_ifgs(volcnet_file, ny, nx, deformation_masks = False):
+    """ Open a volcnet file, and get it ready for making interferograms from (i.e. rescale it if it's smaller than the output size, and label every
+    pair of acquisitions in pixels, which is cached alongside the file so is only done once).
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        ny | int | output size, in pixels
+        nx | int | as above. 
+        deformation_masks | boolean | if True, the pixel labels also contain a mask of each episode on the (possibly rescaled) grid, so 
+                                      volcnet.labelling.deformation_mask can make a pixel level label of any ifg.  Only for calling this 
+                                      directly, as create_volcnet_ifgs and volcnet_ifg_generator don't make pixel level labels.  
+
+    Returns:
+        displacement_r3 | dict | as in open_volcnet_file, but possibly rescaled.
+        pixel_labels | dict | output of volcnet.labelling.open_pixel_labels, for the (possibly rescaled) grid.  
+
+    History:
+        2026_10_18 | MEG | Written, from create_volcnet_ifgs.
+        2026_10_18 | MEG | Also return a GeoTransform.  
+        2026_10_18 | MEG | Return cached pixel labels instead of the label model and GeoTransform.  
+        2026_10_18 | MEG | Add deformation_masks option.  
+        2026_10_18 | MEG | Rescale with volcnet.resampling (and cache the result) rather than deep_learning_tools.  
+    """
+    from volcnet.labelling import compile_label_model, open_pixel_labels
+    from volcnet.annotations import Episodes
+    from volcnet.aux import GeoTransform
+    from volcnet.file_handling import open_volcnet_file
+    from volcnet.resampling import open_rescaled_timeseries
+
+    print(f"Opening file: {str(volcnet_file).split('/')[-1]}")
+    displacement_r3, tbaseline_info, persistent_defs, transient_defs = open_volcnet_file(volcnet_file)          # .volcnet directories are memory mapped, so only the acquisitions used are read.
+    episodes = Episodes.from_defs(persistent_defs, transient_defs)                                              # compact form of the labels
+    label_model = compile_label_model(episodes)                                                                 # compile the labels once per file, as it's used for every ifg
+
+    n_acq, ny_original, nx_original = displacement_r3['cumulative'].shape
+    print(f"The interferograms are of size: {displacement_r3['mask'].shape}")
+
+    if (nx_original < nx) or (ny_original < ny):
+        if ny_original/nx_original < 1:                                                                                                       # this is less than 1 if the image is wider than tall.
+            rescale_factor = (1.4 * ny) /ny_original                                                   #rescale to ensure y is large enough to be cropped down to 224
         else:
-            if current_file == int(ifg_info[0]):
-                open_volcnet_file = False
-            else:
-                current_file = int(ifg_info[0])
-                open_volcnet_file = True
+            rescale_factor = (1.4 * ny) / nx_original
+
+        displacement_r3 = open_rescaled_timeseries(volcnet_file, displacement_r3, rescale_factor)          # cached alongside the file, so only rescaled once for each size
+        print(f"The interferograms have been interpolated to size: {displacement_r3['mask'].shape}")
+
+    geotransform = GeoTransform.from_lonlats(displacement_r3['lons'], displacement_r3['lats'])                    # after any rescaling
+    if deformation_masks:
+        mask_shape = displacement_r3['mask'].shape[-2:]
+    else:
+        mask_shape = None
+    pixel_labels = open_pixel_labels(volcnet_file, tbaseline_info, persistent_defs, transient_defs, label_model, geotransform, mask_shape)
+
+    return displacement_r3, pixel_labels
+
+
+#%%
+
+def labels_blocks(labels_all, n_ifgs_per_block):
+    """ Split labels_all into blocks of at most n_ifgs_per_block rows, where each block only contains rows from one volcnet file.  
+    The order of the rows is not changed.  
+    
+    Inputs:
+        labels_all | many x 4 |  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
+        n_ifgs_per_block | int | maximum number of rows in a block.  
         
-        if open_volcnet_file:
-            print(f"Opening file: {volcnet_files[current_file].split('/')[-1]}")
-            with open(volcnet_files[current_file], 'rb') as f:
-                displacement_r3 = pickle.load(f)
-                tbaseline_info = pickle.load(f)
-                persistent_defs = pickle.load(f)
-                transient_defs = pickle.load(f)
-                
-            n_acq, ny_original, nx_original = displacement_r3['cumulative'].shape
-            n_ifg = (n_acq*n_acq) - n_acq
-            print(f"The interferograms are of size: {displacement_r3['mask'].shape}")
-           
-            if (nx_original < nx) or (ny_original < ny):
-                if ny_original/nx_original < 1:                                                                                                       # this is less than 1 if the image is wider than tall.  
-                    rescale_factor = (1.4 * ny) /ny_original                                                   #rescale to ensure y is large enough to be cropped down to 224    
-                else:
-                    rescale_factor = (1.4 * ny) / nx_original
-                    
-                displacement_r3 = rescale_timeseries(displacement_r3, rescale_factor)
-                print(f"The interferograms have been interpolated to size: {displacement_r3['mask'].shape}")
-            
-         # 1:
-        acq_n1 = int(ifg_info[1])                                                                                                   # stored as a float, so convert
-        acq_n2 = int(ifg_info[2])
-        acq_1 = tbaseline_info['acq_dates'][acq_n1]                                                                                 # get the acquisition date in form YYYYMMDD instead of a number
-        acq_2 = tbaseline_info['acq_dates'][acq_n2]
+    Returns (yields):
+        file_n | int | file number of the block
+        labels_block | n_ifgs x 4 | rows of labels_all
         
-        ifg = displacement_r3['cumulative'][acq_n2,] - displacement_r3['cumulative'][acq_n1,]                                     # make the ifg between the two acquisitions.  
-        def_predicted, sources, def_location = label_volcnet_ifg(f"{acq_1}_{acq_2}", persistent_defs, transient_defs)             # label the ifg, def_location is still in terms of lon and lat
-        def_loc_pixels = ll_2_pixel(def_location, displacement_r3['lons'], displacement_r3['lats'])                               # convert the location label from lon lat to pixels (x then y)
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
     
-        if (np.abs(def_predicted) < volcnet_def_min):                                                                             # if the deformation is less than the threshold selected       
-            ifg_cropped_r3 = random_cropping(ifg, ny, None)    
-        else:                                                                                                                       # else deformation is big enough
-            ifg_cropped_r3, Y_loc_cropped = random_cropping(ifg, ny, def_loc_pixels)    
-        
+    file_ns = labels_all[:, 0].astype(int)
+    run_bounds = [0] + list(np.flatnonzero(np.diff(file_ns)) + 1) + [file_ns.shape[0]]                         # start and stop of each run of rows from the same file
+    for run_start, run_stop in zip(run_bounds[:-1], run_bounds[1:]):
+        for block_start in range(run_start, run_stop, n_ifgs_per_block):
+            yield int(file_ns[run_start]), labels_all[block_start : min(block_start + n_ifgs_per_block, run_stop)]
+
+
+#%%
+
+def ifgs_crops_and_labels(labels_block, displacement_r3, pixel_labels, ny, volcnet_def_min):
+    """ Make a block of interferograms from the same volcnet file, label them, and randomly crop them.  
+    All the interferograms are made in one indexing operation, and the crops and labels are written to the outputs in blocks.  
+
+    Inputs:
+        labels_block | n_ifgs x 4 | rows of labels_all, all from the same file.  File number, acquisition 1, acquisition 2, deformation magnitude
+        displacement_r3 | dict | output of open_volcnet_file_for_ifgs
+        pixel_labels | dict | output of open_volcnet_file_for_ifgs
+        ny | int | output size, in pixels
+        volcnet_def_min | float | deformation must be above this (in metres) be classed as deformation.
+
+    Returns:
+        X_crops | (n_ifgs x n_crops) x ny x nx x 1 | masked array of the crops of the interferograms.  The crops of the first ifg, then the second etc.  
+        Y_class_crops | (n_ifgs x n_crops) x 3 | one hot encoding of dyke, sill, atmo (the same for each crop of an ifg)
+        Y_loc_crops | (n_ifgs x n_crops) x 4 | location of deformation in each crop.
+
+    History:
+        2026_10_18 | MEG | Written, from create_volcnet_ifgs.
+        2026_10_18 | MEG | Labels come from the pixel labels cache, so there's no labelling or coordinate conversion per ifg.  
+    """
+    import numpy as np
+    import numpy.ma as ma
+
+    from deep_learning_tools.data_handling import random_cropping
     
-        for crop_n in range(9):
-            if data_n < (n_data_per_file - 1):                                                                                   # check that aren't overfilling X
-                X[data_n,] = ifg_cropped_r3[:,:,crop_n : crop_n + 1]
-                if (np.abs(def_predicted) < volcnet_def_min):                                                                              # if the deformation is less than the threshold selected       
-                    Y_class[data_n,] = np.array([0,0,1])                                                                                    # this is the one hot encoding for atmo
-                    Y_loc[data_n,] = np.array([0,0,0,0])
-                else:                                                                                                                       # else deformation is big enough
-                    if sources[0] == 'dyke':
-                        Y_class[data_n,] = np.array([1,0,0])                                                                                # this is the one hot encoding for dyke
-                    elif sources[0] == 'sill':
-                        Y_class[data_n,] = np.array([0,1,0])                                                                                # this is the one hot encoding for sill
-                    Y_loc[data_n] = Y_loc_cropped[crop_n, ]
-                data_n += 1
-            else:
-                pass
-                
-        # When generated the required number per file, save the file.  
-        if data_n == (n_data_per_file - 1):                         
-            print(f"    Saving file {file_n}")
-            with open(outdir / f"data_file_unshuffled_{file_n:05d}.pkl", 'wb') as f:                     # save the output as a pickle
-                pickle.dump(X, f)
-                pickle.dump(Y_class, f)
-                pickle.dump(Y_loc, f)
-            file_n += 1                                                                                                                                         # advance to next file
-            data_n = 0                                                                                                                                          # initiate for next file        
-            X, Y_class, Y_loc = initialise_arrays(n_data_per_file, ny, nx, 1)            # initiliase for next file.  
-        
+    n_crops = 9                                                                                                                 # random_cropping makes 9 crops of each ifg.  
+    n_ifgs = labels_block.shape[0]
+    acq_n1s = labels_block[:, 1].astype(int)                                                                                    # stored as a float, so convert
+    acq_n2s = labels_block[:, 2].astype(int)
+    ifgs = displacement_r3['cumulative'][acq_n2s,] - displacement_r3['cumulative'][acq_n1s,]                                    # make all the ifgs in one go.  
+
+    X_crops = ma.zeros((n_ifgs * n_crops, ny, ny, 1))                                                                          # random_cropping makes square crops
+    Y_class_crops = np.zeros((n_ifgs * n_crops, 3))
+    Y_loc_crops = np.zeros((n_ifgs * n_crops, 4))
+
+    for ifg_n, (acq_n1, acq_n2) in enumerate(zip(acq_n1s, acq_n2s)):
+        def_predicted = pixel_labels['def_predicted'][acq_n1, acq_n2]                                                           # look up the label of the ifg
+        location_n = pixel_labels['location_ns'][acq_n1, acq_n2]
+        sources = pixel_labels['sources'][location_n]
+        crops = slice(ifg_n * n_crops, (ifg_n + 1) * n_crops)                                                                   # where this ifg's crops go in the outputs
         
+        if (np.abs(def_predicted) < volcnet_def_min):                                                                         # if the deformation is less than the threshold selected
+            ifg_cropped_r3 = random_cropping(ifgs[ifg_n], ny, None)
+            Y_class_crops[crops] = np.array([0,0,1])                                                                            # this is the one hot encoding for atmo
+        else:                                                                                                                   # else deformation is big enough
+            def_loc_pixels = pixel_labels['def_loc_pixels'][location_n]                                                         # already in pixels (x then y)
+            ifg_cropped_r3, Y_loc_cropped = random_cropping(ifgs[ifg_n], ny, np.copy(def_loc_pixels))                            # copy so the cache can't be modified
+            if sources[0] == 'dyke':
+                Y_class_crops[crops] = np.array([1,0,0])                                                                        # this is the one hot encoding for dyke
+            elif sources[0] == 'sill':
+                Y_class_crops[crops] = np.array([0,1,0])                                                                        # this is the one hot encoding for sill
+            Y_loc_crops[crops] = Y_loc_cropped[:n_crops]
+        X_crops[crops] = np.moveaxis(ifg_cropped_r3[:, :, :n_crops], 2, 0)[:, :, :, np.newaxis]                               # crops are last dimension, move to first and add the channel dimension.  
+
+    return X_crops, Y_class_crops, Y_loc_crops
 
 
+#%%
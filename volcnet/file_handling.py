@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:31 2026
+
+@author: matthew
+
+Reading and writing VolcNet files.
+
+The original VolcNet files are .pkl files that contain four sequential pickles (displacement_r3, tbaseline_info, persistent_defs and transient_defs).
+To get anything from these, the whole cumulative displacement cube has to be unpickled.
+
+The .volcnet format is a directory that contains:
+    header.json | tbaseline_info, persistent_defs, transient_defs, and a description of each array.
+    <key>.npy | one for each array in displacement_r3 (e.g. cumulative.npy, mask.npy, lons.npy, lats.npy, dem.npy)
+    <key>_mask.npy | the mask of any arrays in displacement_r3 that are masked arrays.
+
+The arrays can be memory mapped, and the labels can be read from the header without touching the pixel data.
+"""
+
+import pdb
+
+volcnet_format_version = 1
+volcnet_dir_suffix = '.volcnet'
+pixel_labels_suffix = '.pixel_labels'                                       # not .pkl so it isn't picked up when globbing for VolcNet files
+rescaled_suffix = '.rescaled'
+pyramid_suffix = '.pyramid'
+labels_backup_suffix = '.labels_backup'                                     # the labels of a .pkl file while they're being rewritten
+
+#%%
+
+def open_volcnet_file(volcnet_file, mmap = True):
+    """ Open a VolcNet file, either an original .pkl file or a .volcnet directory.
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        mmap | boolean | if True, the arrays of a .volcnet directory are memory mapped (read only) rather than read into memory.  Not used for .pkl files.
+
+    Returns:
+        displacement_r3 | dict | contains cumulative, mask, lons, lats and (for most files) dem.  cumulative (and dem) are masked arrays.
+        tbaseline_info | dict | contains acq_dates and baselines_cumulative.
+        persistent_defs | list of dicts | Info on each type of persistent deformation in the time series.
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    import numpy.ma as ma
+    import pickle
+    from pathlib import Path
+
+    volcnet_file = Path(volcnet_file)
+
+    if not volcnet_file.is_dir():                                                                         # original format, four pickles.
+        with open(volcnet_file, 'rb') as f:
+            displacement_r3 = pickle.load(f)
+            tbaseline_info = pickle.load(f)
+            persistent_defs = pickle.load(f)
+            transient_defs = pickle.load(f)
+        return displacement_r3, tbaseline_info, persistent_defs, transient_defs
+
+    header = read_volcnet_header(volcnet_file)
+    mmap_mode = 'r' if mmap else None
+
+    displacement_r3 = {}
+    for key, array_info in header['arrays'].items():
+        data = np.load(volcnet_file / array_info['file'], mmap_mode = mmap_mode)
+        if array_info['mask_file'] is not None:
+            mask = np.load(volcnet_file / array_info['mask_file'], mmap_mode = mmap_mode)
+            displacement_r3[key] = ma.masked_array(data, mask = mask, copy = False)                     # copy = False so memory mapped arrays stay memory mapped
+        else:
+            displacement_r3[key] = data
+    displacement_r3.update(header['other'])
+
+    tbaseline_info, persistent_defs, transient_defs = labels_from_header(header)
+
+    return displacement_r3, tbaseline_info, persistent_defs, transient_defs
+
+
+#%%
+
+def open_volcnet_labels(volcnet_file, get_ifg_shape = False):
+    """ Open only the time and label information in a VolcNet file.  For a .volcnet directory this only reads the header, and 
+    for a .pkl file the first pickle (displacement_r3) is skipped over without unpickling it (see skip_pickle).  
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        get_ifg_shape | boolean | if True, ifg_shape is also found for .pkl files, which needs displacement_r3 so reads the whole file.  
+
+    Returns:
+        tbaseline_info | dict | contains acq_dates and baselines_cumulative.
+        persistent_defs | list of dicts | Info on each type of persistent deformation in the time series.
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.
+        ifg_shape | tuple or None | ny, nx of the interferograms.  None for .pkl files, unless get_ifg_shape is True.  
+
+    History:
+        2026_10_18 | MEG | Written.
+        2026_10_18 | MEG | Skip over displacement_r3 of .pkl files, and add get_ifg_shape.  
+    """
+    import pickle
+    from pathlib import Path
+
+    volcnet_file = Path(volcnet_file)
+
+    if volcnet_file.is_dir():
+        header = read_volcnet_header(volcnet_file)
+        tbaseline_info, persistent_defs, transient_defs = labels_from_header(header)
+        ifg_shape = tuple(header['arrays']['cumulative']['shape'][1:])
+    elif get_ifg_shape:
+        displacement_r3, tbaseline_info, persistent_defs, transient_defs = open_volcnet_file(volcnet_file)
+        ifg_shape = displacement_r3['mask'].shape
+    else:
+        with open(volcnet_file, 'rb') as f:
+            skip_pickle(f)                                                                                  # displacement_r3, which is most of the file
+            tbaseline_info = pickle.load(f)
+            persistent_defs = pickle.load(f)
+            transient_defs = pickle.load(f)
+        ifg_shape = None
+
+    return tbaseline_info, persistent_defs, transient_defs, ifg_shape
+
+
+#%%
+
+def read_volcnet_header(volcnet_dir):
+    """ Read the header.json of a .volcnet directory.
+    Inputs:
+        volcnet_dir | string or pathlib Path | .volcnet directory
+    Returns:
+        header | dict | see write_volcnet_dir
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import json
+    from pathlib import Path
+
+    with open(Path(volcnet_dir) / 'header.json', 'r') as f:
+        header = json.load(f)
+    if header['format_version'] > volcnet_format_version:
+        raise Exception(f"{volcnet_dir} is .volcnet format version {header['format_version']}, but only up to version {volcnet_format_version} can be read.  ")
+    return header
+
+
+#%%
+
+def labels_from_header(header):
+    """ Convert the JSON friendly versions of tbaseline_info, persistent_defs and transient_defs in a .volcnet header back to the
+    forms used in the .pkl files (i.e. rank 1 arrays and polygons as lists of tuples).
+
+    Inputs:
+        header | dict | output of read_volcnet_header
+    Returns:
+        tbaseline_info | dict |
+        persistent_defs | list of dicts |
+        transient_defs | list of dicts |
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+
+    tbaseline_info = {}
+    for key, value in header['tbaseline_info'].items():
+        if key in header['tbaseline_info_arrays']:
+            tbaseline_info[key] = np.array(value, dtype = header['tbaseline_info_arrays'][key])
+        else:
+            tbaseline_info[key] = value
+
+    persistent_defs = []
+    transient_defs = []
+    for defs_json, defs in zip((header['persistent_defs'], header['transient_defs']), (persistent_defs, transient_defs)):
+        for def_json in defs_json:
+            deformation = dict(def_json)
+            deformation['def_polygon'] = [tuple(vertex) for vertex in def_json['def_polygon']]       # JSON doesn't have tuples
+            defs.append(deformation)
+
+    return tbaseline_info, persistent_defs, transient_defs
+
+
+#%%
+
+def write_volcnet_dir(outdir, displacement_r3, tbaseline_info, persistent_defs, transient_defs):
+    """ Write a VolcNet time series to a .volcnet directory.
+
+    Inputs:
+        outdir | string or pathlib Path | directory to create, should end .volcnet
+        displacement_r3 | dict | as in open_volcnet_file
+        tbaseline_info | dict |
+        persistent_defs | list of dicts |
+        transient_defs | list of dicts |
+
+    Returns:
+        .volcnet directory
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    import numpy.ma as ma
+    import json
+    from pathlib import Path
+
+    outdir = Path(outdir)
+    outdir.mkdir(parents = True, exist_ok = True)
+
+    header = {'format_version'        : volcnet_format_version,
+              'arrays'                : {},
+              'other'                 : {},
+              'tbaseline_info'        : {},
+              'tbaseline_info_arrays' : {}}
+
+    # 1: the arrays (i.e. the pixel data), each to its own .npy file so they can be memory mapped.
+    for key, value in displacement_r3.items():
+        if isinstance(value, np.ndarray):                                                                # includes masked arrays
+            np.save(outdir / f"{key}.npy", ma.getdata(value))
+            if ma.isMaskedArray(value):
+                np.save(outdir / f"{key}_mask.npy", ma.getmaskarray(value))
+                mask_file = f"{key}_mask.npy"
+            else:
+                mask_file = None
+            header['arrays'][key] = {'file'      : f"{key}.npy",
+                                     'mask_file' : mask_file,
+                                     'shape'     : list(value.shape),
+                                     'dtype'     : str(value.dtype)}
+        else:
+            header['other'][key] = value
+
+    # 2: the time information.
+    for key, value in tbaseline_info.items():
+        if isinstance(value, np.ndarray):
+            header['tbaseline_info'][key] = value.tolist()
+            header['tbaseline_info_arrays'][key] = str(value.dtype)                                        # so it can be converted back to an array of the same type
+        else:
+            header['tbaseline_info'][key] = [str(i) for i in value] if key == 'acq_dates' else value
+
+    # 3: the labels.
+    header['persistent_defs'] = [def_to_json(persistent_def) for persistent_def in persistent_defs]
+    header['transient_defs'] = [def_to_json(transient_def) for transient_def in transient_defs]
+
+    with open(outdir / 'header.json', 'w') as f:
+        json.dump(header, f, indent = 1)
+
+
+#%%
+
+def def_to_json(deformation):
+    """ Convert a persistent or transient deformation dict to a form that can be written to JSON (i.e. no numpy types).
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    def_json = {}
+    for key, value in deformation.items():
+        if key == 'def_polygon':
+            def_json[key] = [[float(lon), float(lat)] for lon, lat in value]
+        elif key in ['def_episode_start', 'def_episode_stop']:
+            def_json[key] = int(value)
+        elif key == 'source':
+            def_json[key] = str(value)
+        else:
+            def_json[key] = float(value)
+    return def_json
+
+
+#%%
+
+def convert_volcnet_pickle(volcnet_file, outdir = None):
+    """ Convert an original VolcNet .pkl file to a .volcnet directory.
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file
+        outdir | string or pathlib Path or None | directory to write to.  If None, it's written next to the .pkl file, with .pkl replaced by .volcnet
+
+    Returns:
+        volcnet_dir | pathlib Path | the .volcnet directory that was written.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    from pathlib import Path
+
+    volcnet_file = Path(volcnet_file)
+    if outdir is None:
+        outdir = volcnet_file.with_suffix(volcnet_dir_suffix)
+
+    print(f"Converting {volcnet_file.name} to {Path(outdir).name}")
+    displacement_r3, tbaseline_info, persistent_defs, transient_defs = open_volcnet_file(volcnet_file)
+    write_volcnet_dir(outdir, displacement_r3, tbaseline_info, persistent_defs, transient_defs)
+    return Path(outdir)
+
+
+#%%
+
+def label_section_hash(tbaseline_info, persistent_defs, transient_defs):
+    """ A hash of the label section of a VolcNet file (the acquisition dates and the deformation episodes), which only changes
+    if the labels change.  Used to decide if anything derived from the labels needs recalculating.  
+    
+    Inputs:
+        tbaseline_info | dict | contains acq_dates
+        persistent_defs | list of dicts |
+        transient_defs | list of dicts |
+    Returns:
+        label_hash | string | sha1 hex digest
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import hashlib
+    import json
+    
+    label_section = {'acq_dates'       : [str(acq_date) for acq_date in tbaseline_info['acq_dates']],
+                     'persistent_defs' : [def_to_json(persistent_def) for persistent_def in persistent_defs],
+                     'transient_defs'  : [def_to_json(transient_def) for transient_def in transient_defs]}
+    return hashlib.sha1(json.dumps(label_section, sort_keys = True).encode()).hexdigest()
+
+
+#%%
+
+def pixel_labels_path(volcnet_file):
+    """ Path of the pixel labels cache of a VolcNet file (see volcnet.labelling.open_pixel_labels).  Inside a .volcnet directory, or 
+    next to a .pkl file.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    from pathlib import Path
+    
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        return volcnet_file / 'pixel_labels.pkl'
+    else:
+        return volcnet_file.with_name(volcnet_file.name + pixel_labels_suffix)
+
+
+#%%
+
+def rescaled_path(volcnet_file, ny, nx):
+    """ Path of the cache of a VolcNet file rescaled to ny x nx (see volcnet.resampling.open_rescaled_timeseries).  Inside a .volcnet 
+    directory, or next to a .pkl file.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    from pathlib import Path
+    
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        return volcnet_file / f"rescaled_{ny}x{nx}.npz"
+    else:
+        return volcnet_file.with_name(f"{volcnet_file.name}{rescaled_suffix}_{ny}x{nx}.npz")
+
+
+#%%
+
+def pyramid_path(volcnet_file):
+    """ Path of the directory of the pyramid of a VolcNet file (see volcnet.resampling.open_pyramid).  Inside a .volcnet directory, or 
+    next to a .pkl file.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    from pathlib import Path
+    
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        return volcnet_file / 'pyramid'
+    else:
+        return volcnet_file.with_name(volcnet_file.name + pyramid_suffix)
+
+
+#%%
+
+def write_volcnet_labels(volcnet_file, persistent_defs, transient_defs):
+    """ Replace the labels (persistent_defs and transient_defs) of a VolcNet file, without reading or rewriting the pixel data.  
+    For a .volcnet directory, only header.json is rewritten.  For a .pkl file, the end of the first pickle (displacement_r3) is found by 
+    skipping over its opcodes (see skip_pickle), and everything after it is rewritten.  The new labels are pickled before the file is changed, 
+    and the old ones are copied to <file>.pkl.labels_backup first, so they are put back if the write fails.  If the write was interrupted 
+    (so the backup is still there), the old labels are put back the next time this is called, before the new ones are written.  
+    
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        persistent_defs | list of dicts | new labels.  
+        transient_defs | list of dicts | new labels.  
+    Returns:
+        volcnet_file is updated.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Pickle the new labels before truncating a .pkl file, and back up the old ones.  
+    """
+    import json
+    import os
+    import pickle
+    from pathlib import Path
+    
+    volcnet_file = Path(volcnet_file)
+    
+    if volcnet_file.is_dir():
+        header = read_volcnet_header(volcnet_file)
+        header['persistent_defs'] = [def_to_json(persistent_def) for persistent_def in persistent_defs]
+        header['transient_defs'] = [def_to_json(transient_def) for transient_def in transient_defs]
+        header_tmp = volcnet_file / 'header_tmp.json'
+        with open(header_tmp, 'w') as f:
+            json.dump(header, f, indent = 1)
+        header_tmp.replace(volcnet_file / 'header.json')                                                     # so an interrupted write can't leave a broken header
+    else:
+        labels_backup = volcnet_file.with_name(volcnet_file.name + labels_backup_suffix)
+        with open(volcnet_file, 'r+b') as f:
+            displacement_r3_end = skip_pickle(f)                                                            # file position after displacement_r3
+            
+            # 0: if a previous write was interrupted, put the old labels back.  
+            if labels_backup.exists():
+                print(f"Restoring the labels of {volcnet_file.name} from {labels_backup.name}, as they were not completely written last time.  ")
+                with open(labels_backup, 'rb') as f_backup:
+                    old_tail = f_backup.read()
+                write_pickle_tail(f, displacement_r3_end, old_tail)
+                labels_backup.unlink()
+            
+            # 1: make the new end of the file (tbaseline_info and the labels), before anything is changed.  
+            f.seek(displacement_r3_end)
+            old_tail = f.read()
+            f.seek(displacement_r3_end)
+            tbaseline_info = pickle.load(f)                                                                 # small, and needs rewriting as it's before the labels.  
+            new_tail = pickle.dumps(tbaseline_info) + pickle.dumps(persistent_defs) + pickle.dumps(transient_defs)
+            
+            # 2: back up the old end of the file, then replace it.  
+            labels_backup_tmp = labels_backup.with_name(labels_backup.name + '_tmp')
+            with open(labels_backup_tmp, 'wb') as f_backup:
+                f_backup.write(old_tail)
+                f_backup.flush()
+                os.fsync(f_backup.fileno())
+            labels_backup_tmp.replace(labels_backup)                                                          # so the backup only exists once it's complete
+            try:
+                write_pickle_tail(f, displacement_r3_end, new_tail)
+            except BaseException:
+                write_pickle_tail(f, displacement_r3_end, old_tail)
+                labels_backup.unlink()
+                raise
+        labels_backup.unlink()
+
+
+#%%
+
+def write_pickle_tail(f, position, tail):
+    """ Replace everything in an open file after position with tail, and flush it to disk.  
+    Inputs:
+        f | file object | opened in r+b mode.  
+        position | int | position to write from.  
+        tail | bytes | new end of the file.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import os
+    
+    f.seek(position)
+    f.truncate()
+    f.write(tail)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+#%%
+
+def skip_pickle(f):
+    """ Move the position of an open file to the end of the pickle that starts at the current position, without unpickling it.  
+    The opcodes are read one at a time, and the data of any that carry data (e.g. the bytes of a numpy array) are skipped with seek, 
+    so it's very fast even for pickles that are GBs.  
+    
+    Inputs:
+        f | file object | opened in binary mode, at the start of a pickle.  
+    Returns:
+        position | int | the position of the end of the pickle (which is also the new position of f).  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import pickletools
+    import struct
+    
+    opcodes = {opcode.code.encode('latin-1') : opcode for opcode in pickletools.opcodes}
+    argument_lengths = {pickletools.TAKEN_FROM_ARGUMENT1  : (1, '<B'),                                       # number of bytes of the length of the data, and their format
+                        pickletools.TAKEN_FROM_ARGUMENT4  : (4, '<i'),
+                        pickletools.TAKEN_FROM_ARGUMENT4U : (4, '<I'),
+                        pickletools.TAKEN_FROM_ARGUMENT8U : (8, '<Q')}
+    
+    while True:
+        code = f.read(1)
+        if code == b'':
+            raise EOFError("Reached the end of the file before the end of the pickle.  ")
+        opcode = opcodes[code]
+        if opcode.name == 'STOP':
+            return f.tell()
+        argument = opcode.arg
+        if argument is None:
+            continue
+        elif argument.n >= 0:                                                                               # fixed length argument
+            f.seek(argument.n, 1)
+        elif argument.n == pickletools.UP_TO_NEWLINE:                                                       # text argument (protocol 0)
+            f.readline()
+            if argument.name == 'stringnl_noescape_pair':                                                   # e.g. GLOBAL, which is a module and a name on two lines
+                f.readline()
+        else:                                                                                               # length of the data, then the data
+            n_bytes, length_format = argument_lengths[argument.n]
+            length = struct.unpack(length_format, f.read(n_bytes))[0]
+            f.seek(length, 1)
+
+
+#%%
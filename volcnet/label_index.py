@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:52 2026
+
+@author: matthew
+
+A store of the labels of each VolcNet file (i.e. the outputs of volcnet.labelling.label_volcnet_file_pairs), so that label_volcnet_files
+only has to relabel the files whose labels (or def_min) have changed.
+
+A label index directory contains:
+    <entry_key>.npz | the labels of one file, in columns (label_types, acq_n1s, acq_n2s, def_predicted).  entry_key is a hash of
+                      the label section of the file (acquisition dates and deformation episodes) and def_min, so an entry is never stale.
+    index.json | the label hash of each VolcNet file seen so far, with the size and modification time of the file when it was hashed.
+                 For .pkl files, this means the whole file (including the pixel data) only has to be read if it has changed.
+"""
+
+import pdb
+
+label_index_format_version = 1
+
+#%%
+
+def open_label_index_entry(label_index_dir, volcnet_file, def_min):
+    """ Get the labels for one VolcNet file from the label index, or calculate them (and add them to the index) if they're not there.
+
+    Inputs:
+        label_index_dir | string or pathlib Path | directory of the label index.  Made if it doesn't exist.
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        def_min | float | magnitude of deformation must be larger than this to be classed as deformation.  Units: metres.
+
+    Returns:
+        file_labels | dict of rank 1 arrays | see volcnet.labelling.label_volcnet_file_pairs
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import hashlib
+    import numpy as np
+    from pathlib import Path
+
+    from volcnet.file_handling import open_volcnet_labels, label_section_hash
+    from volcnet.labelling import label_volcnet_file_pairs
+
+    label_index_dir = Path(label_index_dir)
+    label_index_dir.mkdir(parents = True, exist_ok = True)
+    volcnet_file = Path(volcnet_file)
+
+    # 1: see if the file has been hashed before, and hasn't changed since.
+    index = read_label_index(label_index_dir)
+    file_key = str(volcnet_file.resolve())
+    file_stat = volcnet_file_stat(volcnet_file)
+    labels_opened = False
+    if (file_key in index['files']) and (index['files'][file_key]['stat'] == file_stat):
+        label_hash = index['files'][file_key]['label_hash']
+    else:
+        print(f"Opening file: {volcnet_file.name}")
+        tbaseline_info, persistent_defs, transient_defs, _ = open_volcnet_labels(volcnet_file)
+        labels_opened = True
+        label_hash = label_section_hash(tbaseline_info, persistent_defs, transient_defs)
+        index['files'][file_key] = {'stat'       : file_stat,
+                                    'label_hash' : label_hash}
+        write_label_index(label_index_dir, index)
+
+    # 2: the entry for that label hash and def_min, if it's not there then label the file.
+    entry_key = hashlib.sha1(f"{label_hash}_{float(def_min)!r}".encode()).hexdigest()
+    entry_file = label_index_dir / f"{entry_key}.npz"
+    if entry_file.exists():
+        print(f"Labels for {volcnet_file.name} loaded from the label index.  ")
+        with np.load(entry_file) as entry:
+            file_labels = {key : entry[key] for key in entry.files}
+    else:
+        if not labels_opened:
+            print(f"Opening file: {volcnet_file.name}")
+            tbaseline_info, persistent_defs, transient_defs, _ = open_volcnet_labels(volcnet_file)
+        file_labels = label_volcnet_file_pairs(tbaseline_info, persistent_defs, transient_defs, def_min)
+        entry_file_tmp = label_index_dir / f"{entry_key}_tmp.npz"
+        np.savez(entry_file_tmp, **file_labels)
+        entry_file_tmp.replace(entry_file)                                                               # so an interrupted write can't leave a broken entry
+    return file_labels
+
+
+#%%
+
+def volcnet_file_stat(volcnet_file):
+    """ Size and modification time (ns) of a VolcNet file, or of the header.json of a .volcnet directory (which holds its labels).
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    from pathlib import Path
+
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        volcnet_file = volcnet_file / 'header.json'
+    file_stat = volcnet_file.stat()
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+#%%
+
+def read_label_index(label_index_dir):
+    """ Read the index.json of a label index directory, or start a new one if there isn't one.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import json
+    from pathlib import Path
+
+    index_file = Path(label_index_dir) / 'index.json'
+    if not index_file.exists():
+        return {'format_version' : label_index_format_version,
+                'files'          : {}}
+    with open(index_file, 'r') as f:
+        index = json.load(f)
+    if index['format_version'] > label_index_format_version:
+        raise Exception(f"{index_file} is label index format version {index['format_version']}, but only up to version {label_index_format_version} can be read.  ")
+    return index
+
+
+#%%
+
+def write_label_index(label_index_dir, index):
+    """ Write the index.json of a label index directory.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import json
+    from pathlib import Path
+
+    index_file = Path(label_index_dir) / 'index.json'
+    index_file_tmp = Path(label_index_dir) / 'index_tmp.json'
+    with open(index_file_tmp, 'w') as f:
+        json.dump(index, f, indent = 1)
+    index_file_tmp.replace(index_file)
+
+
+#%%
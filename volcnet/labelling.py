@@ -13,13 +13,15 @@ import pdb
 #%%
 
 
-def label_volcnet_files(volcnet_files, def_min = 0.05):
+def label_volcnet_files(volcnet_files, def_min = 0.05, label_index_dir = None):
     """ Given a list of volcnet files, create all possible labels for the interferograms that can be made between all possible acquisitions.  
     Note that this doesn't actually make the interferograms, so the outputs are small (i.e. not GBs)
     
     Inputs:
-        volcnet_files | list of strings | list of volcnet files to label.  
+        volcnet_files | list of strings | list of volcnet files to label.  Either .pkl files or .volcnet directories.  
         def_min | float | magnitude of deformation must be larger than this to be classed as deformation.  Units: metres.  
+        label_index_dir | string or pathlib Path or None | if not None, the labels of each file are stored here (see volcnet.label_index), 
+                                                           and a file is only relabelled if its labels or def_min have changed.  
         
     Returns:
         labels_dyke | many x 4 | Interferograms that are labelled as dyke.  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
@@ -28,63 +30,800 @@ def label_volcnet_files(volcnet_files, def_min = 0.05):
 
     History:
         2022_10_03 | MEG | Written
+        2026_10_18 | MEG | Label all the pairs for a file at once with label_volcnet_pairs, rather than calling label_volcnet_ifg for each pair.  
+        2026_10_18 | MEG | Also open .volcnet directories, only reading the labels.  
+        2026_10_18 | MEG | Add label_index_dir option.  
+        2026_10_18 | MEG | Only read the labels of .pkl files too.  
     """
     import numpy as np
-    import pickle
-        
-    labels_dyke = np.nan * np.zeros((1, 4))                                         # initialise, 1 x 4.  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
-    labels_sill = np.nan * np.zeros((1, 4))                                          # as above, for next label type
-    labels_atmo = np.nan * np.zeros((1, 4))                                          # as above, for next label type
+    from volcnet.file_handling import open_volcnet_labels
+    from volcnet.label_index import open_label_index_entry
+    
+    labels_dyke = []                                                                    # one many x 4 array per file, joined at the end.  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
+    labels_sill = []                                                                    # as above, for next label type
+    labels_atmo = []                                                                    # as above, for next label type
     
     for file_n, volcnet_file in enumerate(volcnet_files):                               # loop through files.  
         
-        print(f"Opening file: {volcnet_file.split('/')[-1]}")
-        # 1: Open the file
-        with open(volcnet_file, 'rb') as f:
-            displacement_r3 = pickle.load(f)
-            tbaseline_info = pickle.load(f)
-            persistent_defs = pickle.load(f)
-            transient_defs = pickle.load(f)
-        print(f"The interferograms are of size: {displacement_r3['mask'].shape}")
-        #n_acq, ny, nx = displacement_r3['cumulative'].shape
-        
-       
-        for acq_n1, acq_1 in enumerate(tbaseline_info['acq_dates']):                                                # 
-            for acq_n2, acq_2 in enumerate(tbaseline_info['acq_dates']):
-                if acq_1 == acq_2:                                                                                                          # will just be zeros so ignore.   
-                    pass                                                                                                                      # just leave as nans          
-                else:
-                    #ifg = displacement_r3['cumulative'][acq_n2,] - displacement_r3['cumulative'][acq_n1,]                                      # make the ifg between the two acquisitions.  
-                    def_predicted, sources, def_location = label_volcnet_ifg(f"{acq_1}_{acq_2}", persistent_defs, transient_defs)               # label the ifg, def_location is still in terms of lon and lat
-                    if (np.abs(def_predicted) < def_min):                                                                                       # if the deformation is less than the threshold selected       
-                        labels_atmo[-1] = np.array([file_n, acq_n1, acq_n2, def_predicted])                                                     # put the info for this ifg in the atmo array.  
-                        labels_atmo = np.vstack((labels_atmo, np.nan * np.zeros((1, 4))))                                                       # and extend the atmo array, ready for the next data
-                    else:                                                                                                                       # else deformation is big enough
-                        if sources[0] == 'dyke':
-                            labels_dyke[-1] = np.array([file_n, acq_n1, acq_n2, def_predicted])                                                 # if a dyke, put in the dyke array
-                            labels_dyke = np.vstack((labels_dyke, np.nan * np.zeros((1, 4))))                                                   # and extend array.  
-                        elif sources[0] == 'sill':
-                            labels_sill[-1] = np.array([file_n, acq_n1, acq_n2, def_predicted])                                                 # if a sill, put in sill array.  
-                            labels_sill = np.vstack((labels_sill, np.nan * np.zeros((1, 4))))                                                   # and extend array    
-        #data_indexs[volcnet_file.split('/')[-1]] = (def_magnitudes, labels)
-    labels_dyke = labels_dyke[:-1,:]                                                                                                            # at end, remove last entry as this is the blank one added ready for the next loop.  
-    labels_sill = labels_sill[:-1,:]                                                                                                            # ditto for sill
-    labels_atmo = labels_atmo[:-1,:]                                                                                                            # ditto for atmo.  
+        if label_index_dir is not None:
+            file_labels = open_label_index_entry(label_index_dir, volcnet_file, def_min)                        # only labels the file if it's not in the index.  
+        else:
+            print(f"Opening file: {str(volcnet_file).split('/')[-1]}")
+            tbaseline_info, persistent_defs, transient_defs, ifg_shape = open_volcnet_labels(volcnet_file)      # doesn't need the pixel data
+            if ifg_shape is not None:                                                                           # not known for .pkl files without reading the pixel data
+                print(f"The interferograms are of size: {ifg_shape}")
+            file_labels = label_volcnet_file_pairs(tbaseline_info, persistent_defs, transient_defs, def_min)
+        
+        for label_type, labels in enumerate((labels_dyke, labels_sill, labels_atmo)):
+            label_rows = file_labels['label_types'] == label_type
+            labels_file = np.zeros((np.count_nonzero(label_rows), 4))                                           # preallocate for this label type and this file
+            labels_file[:, 0] = file_n
+            labels_file[:, 1] = file_labels['acq_n1s'][label_rows]
+            labels_file[:, 2] = file_labels['acq_n2s'][label_rows]
+            labels_file[:, 3] = file_labels['def_predicted'][label_rows]
+            labels.append(labels_file)
+            
+    labels_dyke = np.concatenate(labels_dyke + [np.zeros((0, 4))], axis = 0)                                   # join the files, extra empty array ensures an empty list still works.  
+    labels_sill = np.concatenate(labels_sill + [np.zeros((0, 4))], axis = 0)                                   # ditto for sill
+    labels_atmo = np.concatenate(labels_atmo + [np.zeros((0, 4))], axis = 0)                                   # ditto for atmo.  
     return labels_dyke, labels_sill, labels_atmo
 
 
+#%%
+
+def label_volcnet_file_pairs(tbaseline_info, persistent_defs, transient_defs, def_min = 0.05):
+    """ Label every interferogram that can be made from one volcnet file as dyke, sill, or atmo.  
+    
+    Inputs:
+        tbaseline_info | dict | contains acq_dates
+        persistent_defs | list of dicts or volcnet.annotations.Episodes | Info on each type of persistent deformation in the time series.  
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.  Not used if persistent_defs is Episodes.  
+        def_min | float | magnitude of deformation must be larger than this to be classed as deformation.  Units: metres.  
+        
+    Returns:
+        file_labels | dict of rank 1 arrays | one entry per interferogram, in columns:
+                                                label_types | 0 for dyke, 1 for sill, 2 for atmo.  
+                                                acq_n1s | acquisition 1
+                                                acq_n2s | acquisition 2
+                                                def_predicted | deformation magnitude (m)
+    History:
+        2026_10_18 | MEG | Written, from label_volcnet_files.  
+    """
+    import numpy as np
+    
+    # 1: label every pair of acquisitions in one go.  
+    def_predicted, source_first = label_volcnet_pairs(tbaseline_info['acq_dates'], persistent_defs, transient_defs)
+    acq_dates = np.array(tbaseline_info['acq_dates'])
+    different_dates = (acq_dates[:, np.newaxis] != acq_dates[np.newaxis, :])                                 # ifgs between the same date will just be zeros so ignore.  
+    atmo = different_dates & (np.abs(def_predicted) < def_min)                                              # if the deformation is less than the threshold selected
+    deformation = different_dates & np.logical_not(atmo)                                                    # else deformation is big enough
+    
+    # 2: the pairs of each label type, dyke then sill then atmo.  
+    label_types = []
+    acq_n1s = []
+    acq_n2s = []
+    for label_type, label_pairs in enumerate((deformation & (source_first == 'dyke'), deformation & (source_first == 'sill'), atmo)):
+        acq_n1s_type, acq_n2s_type = np.nonzero(label_pairs)                                                # row major, so in the same order as looping through acq_n1 then acq_n2
+        label_types.append(np.full(acq_n1s_type.shape, label_type, dtype = np.uint8))
+        acq_n1s.append(acq_n1s_type)
+        acq_n2s.append(acq_n2s_type)
+    
+    file_labels = {'label_types'   : np.concatenate(label_types),
+                   'acq_n1s'       : np.concatenate(acq_n1s).astype(np.int32),
+                   'acq_n2s'       : np.concatenate(acq_n2s).astype(np.int32)}
+    file_labels['def_predicted'] = def_predicted[file_labels['acq_n1s'], file_labels['acq_n2s']]
+    return file_labels
+
+
+#%%
+
+def create_sample_plan(labels_dyke, labels_sill, labels_atmo, n_ifgs, class_ratios = (1, 1, 1), strata = None, replace = False,
+                       group_by_file = True, random_seed = 0):
+    """ Given the labels for all the interferograms that could be made (i.e. the outputs of label_volcnet_files), choose which to make so that 
+    the classes are balanced (in the ratios given), and each class is spread evenly across volcanoes (or files).  This can then be used as labels_all
+    in create_volcnet_ifgs, so only the interferograms that will be used are made.  
+    
+    Inputs:
+        labels_dyke | many x 4 | Interferograms that are labelled as dyke.  First coumn is file number, second is acquisition 1, third is acquisition 2, fourth is deformation magnitude
+        labels_sill | many x 4 |
+        labels_atmo | many x 4 |
+        n_ifgs | int | total number of interferograms in the plan.  Note that create_volcnet_ifgs makes several crops of each.  
+        class_ratios | tuple of 3 | relative number of dyke, sill and atmo interferograms.  e.g. (1,1,2) would be 25% dyke, 25% sill, 50% atmo
+        strata | rank 1 array or None | stratum (e.g. volcano) number for each file number.  Each class is split as evenly as possible between the strata, 
+                                        with strata that don't have enough interferograms topped up by the others.  If None, each file is its own stratum.  
+                                        See volcano_strata.  
+        replace | boolean | if True, interferograms can be chosen more than once (so small classes/strata can be oversampled).  If False, 
+                            classes that don't have enough interferograms will have fewer in the plan.  
+        group_by_file | boolean | if True, the plan is (stably) sorted by file number so that create_volcnet_ifgs opens each file once.  The order 
+                                  within each file is still random.  If False, the plan is fully shuffled.  
+        random_seed | int | seed for the random number generator, so the plan is reproducible.  
+        
+    Returns:
+        labels_plan | n_ifgs x 4 | as the label arrays, for the interferograms chosen.  Fewer rows if replace is False and a class doesn't 
+                                   have enough interferograms.  
+        
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Split n_ifgs between the classes by largest remainder, so classes with a ratio of 0 get none and the total is n_ifgs.  
+    """
+    import numpy as np
+    
+    rng = np.random.default_rng(random_seed)
+    class_ratios = np.array(class_ratios, dtype = float)
+    quotas = n_ifgs * class_ratios / np.sum(class_ratios)
+    n_per_class = np.floor(quotas).astype(int)
+    remainders = np.where(class_ratios > 0, quotas - n_per_class, -1.)                                      # classes with a ratio of 0 never get any of the leftover
+    n_per_class[np.argsort(-remainders, kind = 'stable')[:n_ifgs - np.sum(n_per_class)]] += 1               # leftover to the largest fractional parts
+    assert np.sum(n_per_class) == n_ifgs, f"The classes have {np.sum(n_per_class)} interferograms, not {n_ifgs}.  "
+    
+    n_short = 0                                                                                             # number fewer than n_per_class, if a class doesn't have enough
+    labels_plan = []
+    for labels, n_class, class_name in zip((labels_dyke, labels_sill, labels_atmo), n_per_class, ('dyke', 'sill', 'atmo')):
+        if n_class == 0:
+            continue
+        if labels.shape[0] == 0:
+            print(f"No {class_name} interferograms are available, so none will be in the plan.  ")
+            n_short += n_class
+            continue
+        
+        # 1: work out how many of each stratum to use (as evenly as possible, topping up from the others if a stratum doesn't have enough)
+        file_ns = labels[:, 0].astype(int)
+        label_strata = file_ns if strata is None else np.asarray(strata)[file_ns]
+        strata_class, label_strata = np.unique(label_strata, return_inverse = True)
+        n_available = np.bincount(label_strata, minlength = strata_class.shape[0])
+        n_chosen = np.zeros(strata_class.shape[0], dtype = int)
+        n_remaining = n_class if replace else min(n_class, labels.shape[0])
+        if n_remaining < n_class:
+            print(f"Only {labels.shape[0]} {class_name} interferograms are available, so the plan will have {n_remaining} of them (not {n_class}).  ")
+            n_short += n_class - n_remaining
+        while n_remaining > 0:
+            strata_open = np.arange(strata_class.shape[0]) if replace else np.flatnonzero(n_chosen < n_available)
+            shares = np.full(strata_open.shape[0], n_remaining // strata_open.shape[0])
+            shares[rng.choice(strata_open.shape[0], n_remaining % strata_open.shape[0], replace = False)] += 1        # spread the remainder randomly
+            if not replace:
+                shares = np.minimum(shares, n_available[strata_open] - n_chosen[strata_open])                        # can't take more than a stratum has
+            n_chosen[strata_open] += shares
+            n_remaining -= np.sum(shares)
+        
+        # 2: choose the interferograms from each stratum.  
+        for stratum_n in range(strata_class.shape[0]):
+            rows = np.flatnonzero(label_strata == stratum_n)
+            labels_plan.append(labels[rng.choice(rows, n_chosen[stratum_n], replace = replace)])
+    
+    # 3: shuffle, and possibly group by file.  
+    labels_plan = np.concatenate(labels_plan + [np.zeros((0, 4))], axis = 0)
+    assert labels_plan.shape[0] == n_ifgs - n_short, f"The plan has {labels_plan.shape[0]} interferograms, not {n_ifgs - n_short}.  "
+    labels_plan = labels_plan[rng.permutation(labels_plan.shape[0])]
+    if group_by_file:
+        labels_plan = labels_plan[np.argsort(labels_plan[:, 0], kind = 'stable')]
+    return labels_plan
+
+
+#%%
+
+def volcano_strata(volcnet_files, volcano_of_file = None):
+    """ Given a list of volcnet files (e.g. 128D_09016_110500_sierra_negra.pkl), get a stratum number for each file so that files of the same 
+    volcano (e.g. from different frames) are in the same stratum.  For use with create_sample_plan.  
+    The volcano is the file name without the frame name (the first three parts) and without any "crop" part, so that 
+    002A_05136_020502_azores_crop_sao_jorge.pkl and 082D_05128_030500_azores_sao_jorge.pkl are both azores_sao_jorge.  
+    
+    Inputs:
+        volcnet_files | list of strings | list of volcnet files.  
+        volcano_of_file | dict or None | volcano name for any files whose volcano can't be found from the file name, keyed by the file name 
+                                         (e.g. {'002A_05136_020502_azores_crop_sao_jorge.pkl' : 'sao_jorge'}).  Other files are named as above.  
+    Returns:
+        strata | rank 1 array | stratum number for each file.  
+        volcano_names | list of strings | name of each stratum.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Remove "crop" from the volcano names, and add volcano_of_file.  
+    """
+    import numpy as np
+    from pathlib import Path
+    
+    if volcano_of_file is None:
+        volcano_of_file = {}
+    
+    file_volcanoes = []
+    for volcnet_file in volcnet_files:
+        if Path(volcnet_file).name in volcano_of_file:
+            file_volcanoes.append(volcano_of_file[Path(volcnet_file).name])
+        else:
+            name_parts = Path(volcnet_file).stem.split('_')[3:]                                                # remove the frame name (first three parts)
+            file_volcanoes.append('_'.join([name_part for name_part in name_parts if name_part != 'crop']))   # and crop, which is part of some names
+    volcano_names, strata = np.unique(file_volcanoes, return_inverse = True)
+    return strata, [str(volcano_name) for volcano_name in volcano_names]
+
+
+#%%
+
+def label_volcnet_pairs(acq_dates, persistent_defs, transient_defs, label_model = None):
+    """ Given VolcNet labels (persistent and transient defs) for a time series, and the acquisition dates of the time series, calculate the amount
+    of deformation expected in every interferogram that can be made between every pair of acquisitions.  
+    Equivalent to calling label_volcnet_ifg for every pair, but the persistent deformation of every pair is the difference of the cumulative 
+    deformation at each acquisition (see cumulative_deformation), and with the acquisitions in time order the pairs that overlap 
+    with each episode are a rectangle of the n_acq x n_acq arrays, so transients and sources are set one episode at a time.  
+    Agrees with label_volcnet_ifg to rounding error (~1e-15 m), as the persistent episodes are summed in a different order.  
+    
+    Inputs:
+        acq_dates | list of strings | acquisitions, in form YYYYMMDD
+        persistent_defs | list of dicts or volcnet.annotations.Episodes | Info on each type of persistent deformation in the time series.  
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.  Not used if persistent_defs is Episodes.  
+        label_model | dict or None | output of compile_label_model.  If supplied, persistent_defs and transient_defs are not used.  
+        
+    Returns:
+        def_predicted | n_acq x n_acq | Amount of deformation predicted (m) for the interferogram between acquisition row (acq_1) and acquisition column (acq_2)
+        source_first | n_acq x n_acq array of strings | source label of the first deformation episode in the interferogram (i.e. sources[0] in label_volcnet_ifg).  
+                                                         Empty string if no deformation.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Only use the overlapping episodes of each pair, from the episode index.  
+        2026_10_18 | MEG | Persistent deformation from the difference of the cumulative deformation, transients and sources from the rectangle of pairs of each episode.  
+    """
+    import numpy as np
+    from volcnet.aux import dates_to_day_numbers
+    
+    if label_model is None:
+        label_model = compile_label_model(persistent_defs, transient_defs)
+    n_acq = len(acq_dates)
+    n_defs = label_model['def_starts'].shape[0]
+    if n_defs == 0:
+        return np.zeros((n_acq, n_acq)), np.full((n_acq, n_acq), '', dtype = object)
+    
+    # 1: put the acquisitions in time order (they almost always are already), so row acq_1 is before column acq_2 above the diagonal.  
+    acq_days = dates_to_day_numbers(acq_dates)
+    time_order = np.argsort(acq_days, kind = 'stable')
+    acq_days = acq_days[time_order]
+    
+    # 2: persistent deformation is D(acq_2) - D(acq_1), which is also negative for backward ifgs (below the diagonal).  
+    cumulative_def = cumulative_deformation(acq_days, label_model)
+    def_predicted = cumulative_def[np.newaxis, :] - cumulative_def[:, np.newaxis]
+    
+    # 3: transients and the first source.  An episode overlaps with the ifgs with acq_1 before it stops and acq_2 after it starts.  
+    acq_1_stops = np.searchsorted(acq_days, label_model['def_stops'], side = 'left')                       # acq_1 must be before this for the ifg to overlap with each episode
+    acq_2_starts = np.searchsorted(acq_days, label_model['def_starts'], side = 'right')                     # and acq_2 must be from this on
+    def_ns = np.flatnonzero(label_model['def_stops'] > label_model['def_starts'])                           # episodes with no length can't overlap with anything
+    def_transient = np.zeros((n_acq, n_acq))
+    for def_n in def_ns[~label_model['def_persistent'][def_ns]]:                                            # in episode order, as in label_volcnet_ifg
+        def_transient[:acq_1_stops[def_n], acq_2_starts[def_n]:] += label_model['def_values'][def_n]
+    first_def = np.full((n_acq, n_acq), n_defs)
+    for def_n in def_ns[::-1]:                                                                              # backwards, so the first episode is set last
+        first_def[:acq_1_stops[def_n], acq_2_starts[def_n]:] = def_n
+    
+    # 4: the rectangles also include some pairs below the diagonal, so only keep above it and mirror (backward ifgs have the same episodes, but the opposite sign).  
+    upper = np.triu(np.ones((n_acq, n_acq), dtype = bool), k = 1)
+    def_transient = np.where(upper, def_transient, (-1) * def_transient.T)
+    first_def = np.where(upper, first_def, first_def.T)
+    same_day = acq_days[:, np.newaxis] == acq_days[np.newaxis, :]                                           # no overlap with any episode (including repeated dates)
+    def_predicted = np.where(same_day, 0., def_predicted + def_transient)
+    first_def[same_day] = n_defs
+    
+    # 5: back to the order of the acquisitions.  
+    sources = np.array(label_model['sources'] + [''], dtype = object)                                       # extra entry is for no deformation
+    acq_order = np.argsort(time_order)
+    def_predicted = def_predicted[np.ix_(acq_order, acq_order)]
+    source_first = sources[first_def[np.ix_(acq_order, acq_order)]]
+    
+    return def_predicted, source_first
+
+
+#%%
+
+def cumulative_deformation(acq_days, label_model):
+    """ The deformation (m) from the persistent episodes at each acquisition, relative to before any episodes started.  As the deformation of 
+    a persistent episode is linear in time, the deformation in an interferogram from persistent episodes is D(acq_2) - D(acq_1).  
+    Transient episodes are not included, as an interferogram that starts and stops during one still contains all of it, so it is not a step in D.  
+    
+    Inputs:
+        acq_days | rank 1 int | acquisitions, as day numbers (see volcnet.aux.dates_to_day_numbers)
+        label_model | dict | output of compile_label_model.  
+        
+    Returns:
+        cumulative_def | rank 1 | deformation (m) at each acquisition.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    
+    persistent = label_model['def_persistent']
+    def_starts = label_model['def_starts'][persistent]
+    def_stops = np.maximum(label_model['def_stops'][persistent], def_starts)                               # an episode that stops before it starts never deforms
+    days_deforming = np.clip(acq_days[:, np.newaxis], def_starts, def_stops) - def_starts                  # days of each episode before each acquisition
+    cumulative_def = np.sum((days_deforming / 365.25) * label_model['def_values'][persistent], axis = 1)     # convert days to years, then multiply by rate in m/year.  
+    return cumulative_def
+
+
+#%%
+
+def pair_episodes(acq_dates, label_model):
+    """ Find the deformation episodes that overlap with the interferogram between every pair of acquisitions.  
+    
+    Inputs:
+        acq_dates | list of strings | acquisitions, in form YYYYMMDD
+        label_model | dict | output of compile_label_model.  
+        
+    Returns:
+        acq_n1s | rank 1 int | acquisition 1 of each ifg.  Only the ifgs above the diagonal (acq_1 < acq_2) are included, as the ifg
+                               from acq_2 to acq_1 overlaps with the same episodes.  
+        acq_n2s | rank 1 int | acquisition 2 of each ifg.  
+        offsets, episode_ns, overlaps | see overlapping_episodes_many, for these ifgs.  
+        backward_ifg | rank 1 boolean | True if acq_1 is after acq_2, so the signal will be in the opposite sense.  
+    History:
+        2026_10_18 | MEG | Written, from label_volcnet_pairs.  
+        2026_10_18 | MEG | Use the episode index, rather than the overlap of every pair with every episode.  
+    """
+    import numpy as np
+    from volcnet.aux import dates_to_day_numbers
+    
+    # 1: convert the acquisition dates to day numbers once.  
+    acq_days = dates_to_day_numbers(acq_dates)
+    
+    # 2: the start and end of each ifg, flipping backward ifgs so that the start is always first.  
+    acq_n1s, acq_n2s = np.triu_indices(acq_days.shape[0], k = 1)
+    ifg_starts = np.minimum(acq_days[acq_n1s], acq_days[acq_n2s])
+    ifg_stops = np.maximum(acq_days[acq_n1s], acq_days[acq_n2s])
+    backward_ifg = acq_days[acq_n1s] > acq_days[acq_n2s]                                                   # acq_1 after acq_2, so signal will be in the opposite sense.  
+    
+    # 3: the episodes that overlap with each ifg.  
+    offsets, episode_ns, overlaps = overlapping_episodes_many(label_model, ifg_starts, ifg_stops)
+    return acq_n1s, acq_n2s, offsets, episode_ns, overlaps, backward_ifg
 
 
 #%%
 
-def label_volcnet_ifg(ifg_name, persistent_defs, transient_defs, noise_threshold = 0.02):
+def pixel_labels_for_pairs(acq_dates, label_model, geotransform, mask_shape = None):
+    """ Label every pair of acquisitions in a time series in terms of pixels, so that making interferograms doesn't need any labelling or 
+    coordinate conversion.  A time series only has a handful of combinations of overlapping episodes, so the sources and location are stored
+    once for each combination (a "location"), and each pair just stores the number of its location.  
+    
+    Inputs:
+        acq_dates | list of strings | acquisitions, in form YYYYMMDD
+        label_model | dict | output of compile_label_model.  
+        geotransform | volcnet.aux.GeoTransform | for the grid the interferograms will be made on.  
+        mask_shape | tuple or None | (ny, nx) of the grid.  If supplied, each episode is also rasterised onto the grid (see rasterise_episodes),
+                                     so a pixel level label of any ifg can be made with deformation_mask.  
+        
+    Returns:
+        pixel_labels | dict | contains:
+                                def_predicted | n_acq x n_acq | as in label_volcnet_pairs.  
+                                location_ns | n_acq x n_acq int | number of the location of the ifg between acquisition row (acq_1) and acquisition column (acq_2)
+                                sources | list of lists of strings | sources of each location, as in label_volcnet_ifg.  
+                                def_loc_pixels | list of n_vertices x 2 int arrays | polygon around the deformation of each location, in pixels (x then y).  
+                                bboxes | n_locations x 4 | x_min, y_min, x_max, y_max (pixels) of each location.  0s if no deformation.  
+                                and if mask_shape is supplied:
+                                mask_shape | tuple | (ny, nx)
+                                location_episodes | n_locations x n_defs boolean | the episodes that overlap with the ifgs of each location.  
+                                episode_masks | n_defs x ny x ceil(nx/8) uint8 | bit packed (along x) mask of each episode.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Add mask_shape option.  
+    """
+    import numpy as np
+    
+    n_acq = len(acq_dates)
+    n_defs = label_model['def_starts'].shape[0]
+    def_predicted, _ = label_volcnet_pairs(acq_dates, None, None, label_model = label_model)
+    
+    # 1: find the unique combinations of overlapping episodes, and which each pair uses.  
+    if n_defs == 0:
+        episodes_keys = np.zeros((1, 0), dtype = np.uint8)
+        location_ns = np.zeros((n_acq, n_acq), dtype = int)
+    else:
+        acq_n1s, acq_n2s, offsets, episode_ns, _, _ = pair_episodes(acq_dates, label_model)
+        overlapping = np.zeros((n_acq, n_acq, n_defs), dtype = bool)
+        entry_n1s = np.repeat(acq_n1s, np.diff(offsets))                                                    # acquisitions of the ifg of each overlap
+        entry_n2s = np.repeat(acq_n2s, np.diff(offsets))
+        overlapping[entry_n1s, entry_n2s, episode_ns] = True
+        overlapping[entry_n2s, entry_n1s, episode_ns] = True                                                # the reverse ifg overlaps with the same episodes
+        episodes_bits = np.packbits(overlapping.reshape(n_acq * n_acq, n_defs), axis = 1)                   # n_pairs x n_bytes, bitmask of the episodes that overlap with each pair
+        episodes_keys, location_ns = np.unique(episodes_bits, axis = 0, return_inverse = True)
+        location_ns = location_ns.reshape(n_acq, n_acq)
+    
+    # 2: the sources and location of each combination, converted to pixels once.  
+    sources_all = []
+    def_loc_pixels_all = []
+    bboxes = np.zeros((episodes_keys.shape[0], 4), dtype = int)
+    for location_n, episodes_key in enumerate(episodes_keys):
+        overlapping = np.unpackbits(episodes_key, count = n_defs).astype(bool)
+        sources, def_location = label_model_location(label_model, overlapping)
+        sources_all.append(sources)
+        if len(def_location) > 0:
+            def_loc_pixels = geotransform.ll_to_pixel(def_location)
+            bboxes[location_n] = np.concatenate([np.min(def_loc_pixels, axis = 0), np.max(def_loc_pixels, axis = 0)])
+        else:
+            def_loc_pixels = np.zeros((0, 2), dtype = int)
+        def_loc_pixels_all.append(def_loc_pixels)
+    
+    pixel_labels = {'def_predicted'  : def_predicted,
+                    'location_ns'    : location_ns,
+                    'sources'        : sources_all,
+                    'def_loc_pixels' : def_loc_pixels_all,
+                    'bboxes'         : bboxes}
+    if mask_shape is not None:
+        pixel_labels['mask_shape'] = tuple(mask_shape)
+        pixel_labels['location_episodes'] = np.unpackbits(episodes_keys, axis = 1, count = n_defs).astype(bool)
+        pixel_labels['episode_masks'] = rasterise_episodes(label_model, geotransform, mask_shape)
+    return pixel_labels
+
+
+#%%
+
+def rasterise_episodes(label_model, geotransform, mask_shape):
+    """ Rasterise the polygon of each deformation episode onto a grid.  This is done once per time series, and then the pixel level 
+    label of any interferogram is the OR of the masks of the episodes that overlap with it (see deformation_mask).  Unlike the 
+    polygon returned by label_volcnet_ifg, this keeps any parts of the union of the episodes that are separate or surround a hole.  
+    
+    Inputs:
+        label_model | dict | output of compile_label_model.  
+        geotransform | volcnet.aux.GeoTransform | for the grid.  
+        mask_shape | tuple | (ny, nx) of the grid.  
+        
+    Returns:
+        episode_masks | n_defs x ny x ceil(nx/8) uint8 | bit packed (along x, use np.unpackbits(..., axis = -1, count = nx)) mask of each episode.  
+                                                        A pixel is in the mask if its centre is inside the polygon.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    from matplotlib.path import Path
+    
+    ny, nx = mask_shape
+    n_defs = label_model['def_starts'].shape[0]
+    episode_masks = np.zeros((n_defs, ny, nx), dtype = bool)
+    for def_n, def_polygon in enumerate(label_model['def_polygons']):
+        if def_polygon.shape[0] == 0:
+            continue
+        polygon_pixels = geotransform.ll_to_pixel(def_polygon, rounding = False)                           # fractional pixels, x then y
+        x_start, y_start = np.maximum(np.floor(np.min(polygon_pixels, axis = 0)).astype(int), 0)            # only test the pixels in the bounding box of the polygon
+        x_stop, y_stop = np.minimum(np.ceil(np.max(polygon_pixels, axis = 0)).astype(int) + 1, (nx, ny))
+        if (x_stop <= x_start) or (y_stop <= y_start):                                                      # polygon is off the grid
+            continue
+        xs, ys = np.meshgrid(np.arange(x_start, x_stop), np.arange(y_start, y_stop))
+        inside = Path(polygon_pixels).contains_points(np.stack([xs.ravel(), ys.ravel()], axis = 1))
+        episode_masks[def_n, y_start:y_stop, x_start:x_stop] = inside.reshape(xs.shape)
+    return np.packbits(episode_masks, axis = -1)
+
+
+#%%
+
+def deformation_mask(pixel_labels, acq_n1, acq_n2):
+    """ Pixel level label of the interferogram between two acquisitions, from the episode masks of the pixel labels.  
+    For direct callers, e.g. with the pixel labels from volcnet.creating_ifgs.open_volcnet_file_for_ifgs(..., deformation_masks = True), as 
+    create_volcnet_ifgs and volcnet_ifg_generator don't make pixel level labels.  
+    
+    Inputs:
+        pixel_labels | dict | output of pixel_labels_for_pairs (or open_pixel_labels), with mask_shape supplied.  
+        acq_n1 | int | acquisition 1 of the ifg.  
+        acq_n2 | int | acquisition 2 of the ifg.  
+        
+    Returns:
+        def_mask | ny x nx boolean | True where there is deformation.  Note that this is for the whole grid, not for any crops of the ifg.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Remove the case of no overlapping episodes, as the OR of no masks is already all False.  
+    """
+    import numpy as np
+    
+    if 'episode_masks' not in pixel_labels:
+        raise Exception("These pixel labels don't have the episode masks, so must be made with mask_shape supplied.  Exiting.  ")
+    episode_masks = pixel_labels['episode_masks']
+    location_n = pixel_labels['location_ns'][acq_n1, acq_n2]
+    def_mask_packed = np.bitwise_or.reduce(episode_masks[pixel_labels['location_episodes'][location_n]], axis = 0)    # OR of the masks of the overlapping episodes (all 0 if none)
+    return np.unpackbits(def_mask_packed, axis = -1, count = pixel_labels['mask_shape'][1]).astype(bool)
+
+
+#%%
+
+def open_pixel_labels(volcnet_file, tbaseline_info, persistent_defs, transient_defs, label_model, geotransform, mask_shape = None):
+    """ Get the pixel labels for every pair of acquisitions in a VolcNet file, either from the cache saved alongside the file or by
+    calculating them (and then saving them).  The cache is keyed by a hash of the labels and the grid, so it's recalculated if the 
+    labels are changed, or if the time series was rescaled to a different size.  It doesn't depend on any threshold as this is applied 
+    to def_predicted when the interferograms are made.  
+    
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory
+        tbaseline_info | dict | from the VolcNet file.  
+        persistent_defs | list of dicts | from the VolcNet file.  
+        transient_defs | list of dicts | from the VolcNet file.  
+        label_model | dict | output of compile_label_model.  
+        geotransform | volcnet.aux.GeoTransform | for the grid the interferograms will be made on.  
+        mask_shape | tuple or None | see pixel_labels_for_pairs.  
+        
+    Returns:
+        pixel_labels | dict | see pixel_labels_for_pairs
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Add mask_shape option.  
+        2026_10_18 | MEG | Write the cache to a temporary file that then replaces it, so processes sharing the cache can't read a partial write.  
+    """
+    import hashlib
+    import os
+    import pickle
+    from volcnet.file_handling import label_section_hash, pixel_labels_path
+    
+    cache_file = pixel_labels_path(volcnet_file)
+    grid_bytes = geotransform.origin.tobytes() + geotransform.matrix.tobytes()
+    if mask_shape is not None:
+        grid_bytes += f"{tuple(mask_shape)}".encode()                                                      # labels with masks are a different entry
+    key = hashlib.sha1(label_section_hash(tbaseline_info, persistent_defs, transient_defs).encode() + grid_bytes).hexdigest()
+    
+    caches = {}
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                caches = pickle.load(f)                                                                     # one entry for each grid the file has been labelled on.  
+        except (OSError, EOFError, ValueError, AttributeError, pickle.UnpicklingError):
+            print(f"Unable to read {cache_file.name}, so it will be recreated.  ")
+            caches = {}
+    if key in caches:
+        return caches[key]
+    
+    print(f"Labelling every pair of acquisitions in pixels, and saving to {cache_file}")
+    caches[key] = pixel_labels_for_pairs(tbaseline_info['acq_dates'], label_model, geotransform, mask_shape)
+    cache_file_tmp = cache_file.with_name(f"{cache_file.name}_tmp_{os.getpid()}")                         # each process has its own temporary file
+    try:
+        with open(cache_file_tmp, 'wb') as f:
+            pickle.dump(caches, f)
+        cache_file_tmp.replace(cache_file)                                                               # so an interrupted write can't leave a broken cache
+    except OSError:
+        print(f"Unable to write {cache_file}, so the pixel labels will be recalculated next time.  ")
+        cache_file_tmp.unlink(missing_ok = True)
+    return caches[key]
+
+
+#%%
+
+def compile_label_model(persistent_defs, transient_defs = None):
+    """ Given VolcNet labels (persistent and transient defs) for a time series, compile them into a form that is fast to label interferograms with.  
+    The episode dates are converted to day numbers once, and the union of the deformation polygons (and the list of sources) is stored for each 
+    combination of overlapping episodes the first time it is needed, as a time series only has a handful of these.  
+    
+    Inputs:
+        persistent_defs | list of dicts or volcnet.annotations.Episodes | Info on each type of persistent deformation in the time series.  
+                                                                            If Episodes, it contains all the episodes and transient_defs is not used.  
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.  
+        
+    Returns:
+        label_model | dict | contains:
+                                def_starts | rank 1 array | day number of the start of each episode (persistent episodes first, then transient)
+                                def_stops | rank 1 array | day number of the end of each episode
+                                def_persistent | rank 1 boolean | True if the episode is persistent, False if transient.  
+                                def_values | rank 1 array | rate (m/yr) for persistent episodes, magnitude (m) for transient episodes.  
+                                sources | list of strings | source of each episode.  
+                                def_polygons | list of n_vertices x 2 arrays | polygon of each episode.  
+                                location_cache | dict | sources and def_location for each combination of overlapping episodes seen so far.  
+                                episode_index | dict | output of compile_episode_index.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Build from volcnet.annotations.Episodes.  
+        2026_10_18 | MEG | Add an episode index.  
+    """
+    from volcnet.annotations import Episodes
+    
+    episodes = Episodes.from_labels(persistent_defs, transient_defs).ordered()                              # persistent first, then transient, as in label_volcnet_ifg
+    
+    label_model = {'def_starts'     : episodes.starts.copy(),
+                   'def_stops'      : episodes.stops.copy(),
+                   'def_persistent' : episodes.persistent.copy(),
+                   'def_values'     : episodes.values.copy(),
+                   'sources'        : episodes.sources,
+                   'def_polygons'   : [episodes.polygon(episode_n) for episode_n in range(len(episodes))],
+                   'location_cache' : {}}
+    label_model['episode_index'] = compile_episode_index(label_model['def_starts'], label_model['def_stops'])
+    return label_model
+
+
+#%%
+
+def compile_episode_index(def_starts, def_stops):
+    """ Make an index of deformation episodes, so that the episodes that overlap with an interferogram can be found with a binary search 
+    rather than by testing every episode.  The episodes are sorted by start, and the running maximum of their stops is stored, so for an 
+    interferogram (ifg_start, ifg_stop) the only episodes that can overlap are between the first whose running maximum stop is after 
+    ifg_start and the last that starts before ifg_stop.  
+    
+    Inputs:
+        def_starts | rank 1 array | day number of the start of each episode.  
+        def_stops | rank 1 array | day number of the end of each episode.  
+    Returns:
+        episode_index | dict | contains:
+                                order | rank 1 int | episode numbers, sorted by start.  
+                                starts_sorted | rank 1 | starts, in that order.  
+                                stops_sorted | rank 1 | stops, in that order.  
+                                stops_max | rank 1 | running maximum of stops_sorted.  
+                                in_order | boolean | True if the episodes are already sorted by start (so order is 0, 1, 2...)
+                                starts_sorted_list, stops_max_list | lists | as above, for bisect, which is much faster than np.searchsorted for one interferogram.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    
+    order = np.argsort(def_starts, kind = 'stable')
+    episode_index = {'order'         : order,
+                     'starts_sorted' : def_starts[order],
+                     'stops_sorted'  : def_stops[order],
+                     'stops_max'     : np.maximum.accumulate(def_stops[order]) if order.shape[0] > 0 else def_stops[order],
+                     'in_order'      : bool(np.all(np.diff(order) > 0))}
+    episode_index['starts_sorted_list'] = episode_index['starts_sorted'].tolist()
+    episode_index['stops_max_list'] = episode_index['stops_max'].tolist()
+    return episode_index
+
+
+#%%
+
+def overlapping_episodes(label_model, ifg_start, ifg_stop):
+    """ Find the episodes that overlap with one interferogram, using the episode index.  
+    
+    Inputs:
+        label_model | dict | output of compile_label_model.  
+        ifg_start | int | day number of the first acquisition (i.e. the earlier one).  
+        ifg_stop | int | day number of the second acquisition.  
+    Returns:
+        episode_ns | rank 1 int | the episodes that overlap, in episode number order (i.e. the order of the label model)
+        overlaps | rank 1 int | overlap in days of each of these episodes with the interferogram.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    from bisect import bisect_left, bisect_right
+    
+    episode_index = label_model['episode_index']
+    candidate_start = bisect_right(episode_index['stops_max_list'], int(ifg_start))                         # episodes before this all stop before the ifg starts
+    candidate_stop = bisect_left(episode_index['starts_sorted_list'], int(ifg_stop))                         # episodes from this on all start after the ifg stops
+    if candidate_stop <= candidate_start:                                                                    # no episodes can overlap
+        return np.zeros(0, dtype = int), np.zeros(0, dtype = int)
+    candidates = slice(candidate_start, candidate_stop)
+    overlaps = (np.minimum(ifg_stop, episode_index['stops_sorted'][candidates]) - 
+                np.maximum(ifg_start, episode_index['starts_sorted'][candidates]))
+    episode_ns = episode_index['order'][candidates][overlaps > 0]
+    overlaps = overlaps[overlaps > 0]
+    if not episode_index['in_order']:
+        episode_order = np.argsort(episode_ns, kind = 'stable')
+        episode_ns, overlaps = episode_ns[episode_order], overlaps[episode_order]
+    return episode_ns, overlaps
+
+
+#%%
+
+def overlapping_episodes_many(label_model, ifg_starts, ifg_stops):
+    """ Find the episodes that overlap with many interferograms at once, using the episode index.  The result is in compressed sparse row
+    form, so the episodes of interferogram i are episode_ns[offsets[i] : offsets[i+1]].  
+    
+    Inputs:
+        label_model | dict | output of compile_label_model.  
+        ifg_starts | rank 1 int | day number of the first acquisition (i.e. the earlier one) of each interferogram.  
+        ifg_stops | rank 1 int | day number of the second acquisition of each interferogram.  
+    Returns:
+        offsets | rank 1 int | n_ifgs + 1, start of the episodes of each interferogram in episode_ns
+        episode_ns | rank 1 int | the episodes that overlap with each interferogram, in episode number order for each interferogram.  
+        overlaps | rank 1 int | overlap in days of each of these.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    
+    episode_index = label_model['episode_index']
+    n_ifgs = ifg_starts.shape[0]
+    candidate_starts = np.searchsorted(episode_index['stops_max'], ifg_starts, side = 'right')
+    candidate_stops = np.searchsorted(episode_index['starts_sorted'], ifg_stops, side = 'left')
+    n_candidates = np.maximum(candidate_stops - candidate_starts, 0)
+    
+    # 1: every candidate of every ifg, in one array.  
+    ifg_ns = np.repeat(np.arange(n_ifgs), n_candidates)
+    candidate_ns = np.arange(ifg_ns.shape[0]) - np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)       # 0, 1, 2... for the candidates of each ifg
+    sorted_ns = candidate_starts[ifg_ns] + candidate_ns                                                     # position in the sorted episodes
+    overlaps = (np.minimum(ifg_stops[ifg_ns], episode_index['stops_sorted'][sorted_ns]) - 
+                np.maximum(ifg_starts[ifg_ns], episode_index['starts_sorted'][sorted_ns]))
+    
+    # 2: keep only those that overlap, ordered by ifg then episode.  
+    ifg_ns = ifg_ns[overlaps > 0]
+    episode_ns = episode_index['order'][sorted_ns[overlaps > 0]]
+    overlaps = overlaps[overlaps > 0]
+    if not episode_index['in_order']:                                                                       # if the episodes aren't in order of start, sort within each ifg
+        n_defs = episode_index['order'].shape[0]
+        entry_order = np.argsort(ifg_ns.astype(np.int64) * n_defs + episode_ns, kind = 'stable')            # one int key is much faster than np.lexsort
+    else:
+        entry_order = slice(None)                                                                           # already in episode order
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(ifg_ns, minlength = n_ifgs))])
+    return offsets, episode_ns[entry_order], overlaps[entry_order]
+
+
+#%%
+
+def episode_deformations(label_model, overlaps, episode_ns = None):
+    """ Given the overlap (in days) between some interferograms and each deformation episode, calculate the deformation each episode causes in 
+    each interferogram.  Note that the sign of backward interferograms is not handled here.  
+    
+    Inputs:
+        label_model | dict | output of compile_label_model.  
+        overlaps | n_defs x ... | overlap in days of each episode with each interferogram.  Extra dimensions are for the interferograms.  
+                                  Or, if episode_ns is given, rank 1 overlap of each of those episodes.  
+        episode_ns | rank 1 int or None | episode of each overlap, e.g. from overlapping_episodes_many.  
+        
+    Returns:
+        def_episodes | n_defs x ... | deformation (m) due to each episode in each interferogram.  0 if no overlap.  Rank 1 if episode_ns is given.  
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Add episode_ns option.  
+    """
+    import numpy as np
+    
+    if episode_ns is not None:                                                                              # the overlaps are of these episodes
+        def_persistent = label_model['def_persistent'][episode_ns]
+        def_values = label_model['def_values'][episode_ns]
+    else:                                                                                                   # the overlaps are of every episode
+        extra_dims = (np.newaxis,) * (overlaps.ndim - 1)                                                    # so the per episode arrays broadcast against the interferograms
+        def_persistent = label_model['def_persistent'][(slice(None),) + extra_dims]
+        def_values = label_model['def_values'][(slice(None),) + extra_dims]
+    def_episodes = np.where(def_persistent, (overlaps / 365.25) * def_values, def_values)                   # convert days to years, then multiply by rate in m/year.  Transients are just their magnitude.  
+    def_episodes = np.where(overlaps > 0, def_episodes, 0.)
+    return def_episodes
+
+
+#%%
+
+def label_model_location(label_model, overlapping):
+    """ Given a boolean of which episodes overlap with an interferogram, get the sources and the (closed) polygon around the deformation.  
+    The result is cached in the label model for each combination of episodes, so the polygon union is only calculated once.  
+    
+    Inputs:
+        label_model | dict | output of compile_label_model.  
+        overlapping | rank 1 boolean | True for each episode that overlaps with the interferogram.  
+        
+    Returns:
+        sources | list of string | source label for that deformation.  
+        def_location | list of tuple (lon, lat) | Closed polygon around deformation.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import numpy as np
+    from shapely.geometry import Polygon
+    from shapely.ops import unary_union
+    
+    episodes_key = np.packbits(overlapping).tobytes()                                                       # bitmask of the overlapping episodes, hashable so can be a dict key
+    if episodes_key not in label_model['location_cache']:
+        sources = []
+        location_polygon = Polygon([])
+        for def_n in np.nonzero(overlapping)[0]:                                                            # in the same order as label_volcnet_ifg so the polygon is identical
+            if label_model['sources'][def_n] not in sources:
+                sources.append(label_model['sources'][def_n])
+            location_polygon_current = Polygon(label_model['def_polygons'][def_n])
+            location_polygon = unary_union([location_polygon, location_polygon_current])
+        label_model['location_cache'][episodes_key] = (sources, polygon_to_list_tuples(location_polygon))
+    
+    sources, def_location = label_model['location_cache'][episodes_key]
+    return list(sources), list(def_location)                                                                # copies so the cache can't be modified by the caller
+
+
+#%%
+
+def polygon_to_list_tuples(polygon):
+    """Given a shapely polygon, turn it back into a simple list of tuples.  
+    """
+    import numpy as np
+    
+    polygon_list = []
+    
+    x, y = polygon.exterior.coords.xy                                 # get the coords of that
+    x = np.array(x)                                                                     # make into a numpy array, rank 1
+    y = np.array(y)                                                                     # make into a numpy array, rank 1
+    
+    for lon, lat in zip(x, y):
+        polygon_list.append((lon, lat))
+    return polygon_list
+
+
+#%%
+
+def label_volcnet_ifg(ifg_name, persistent_defs, transient_defs, noise_threshold = 0.02, label_model = None):
     """ Given VolcNet labels (persistent and transient defs) for a time series, and the acquisiiton dates for an inteferogram,
     Create a label for it, calculate the amount of deformaiton expected, and the bounding box.  
     
     Inputs:
         ifg_name | string | in form yyyymmdd_yyyymmdd
-        persistent_defs | list of dicts | Info on each type of persistent deformation in the time series.  
-        transient_defs | list of dicts | Info on each type of transient deformation in the time series.  
+        persistent_defs | list of dicts or volcnet.annotations.Episodes | Info on each type of persistent deformation in the time series.  
+        transient_defs | list of dicts | Info on each type of transient deformation in the time series.  Not used if persistent_defs is Episodes.  
+        label_model | dict or None | output of compile_label_model.  If supplied, persistent_defs and transient_defs are not used.  
+                                      Compiling once per time series and passing it here is much faster when labelling many interferograms.  
         
     Returns:
         def_ifg | float | Amount of deforamtion predicted to be in that interferogram (m)
@@ -93,96 +832,39 @@ def label_volcnet_ifg(ifg_name, persistent_defs, transient_defs, noise_threshold
         
     History:
         2022_05_04 | MEG | Written.  
+        2026_10_18 | MEG | Use a compiled label model (day numbers and cached polygon unions).  
+        2026_10_18 | MEG | Only test the episodes that the episode index says could overlap.  
     
     """
     
     import numpy as np
-    from datetime import datetime
+    from volcnet.aux import dates_to_day_numbers
     
-    from collections import namedtuple
-    from shapely.geometry import Polygon
-    from shapely.ops import unary_union
-        
-    def polygon_to_list_tuples(polygon):
-        """Given a shapely polygon, turn it back into a simple list of tuples.  
-        """
-        polygon_list = []
-        
-        x, y = polygon.exterior.coords.xy                                 # get the coords of that
-        x = np.array(x)                                                                     # make into a numpy array, rank 1
-        y = np.array(y)                                                                     # make into a numpy array, rank 1
-        
-        for lon, lat in zip(x, y):
-            polygon_list.append((lon, lat))
-        return polygon_list
-    
-
-    
-    Range = namedtuple('Range', ['start', 'end'])
+    if label_model is None:
+        label_model = compile_label_model(persistent_defs, transient_defs)
     
-    acq_start_dt = datetime.strptime(ifg_name[:8], '%Y%m%d')
-    acq_stop_dt = datetime.strptime(ifg_name[9:], '%Y%m%d')
-    if acq_start_dt > acq_stop_dt:
-        acq_start_dt = datetime.strptime(ifg_name[9:], '%Y%m%d')                # flip so now a standard ifg  1st date -> 2nd date (where 1st comes before)
-        acq_stop_dt = datetime.strptime(ifg_name[:8], '%Y%m%d')                 # continue flip
+    acq_start, acq_stop = dates_to_day_numbers([ifg_name[:8], ifg_name[9:]])
+    if acq_start > acq_stop:
+        acq_start, acq_stop = acq_stop, acq_start                                   # flip so now a standard ifg  1st date -> 2nd date (where 1st comes before)
         backward_ifg = True
     else:
         backward_ifg = False
-        
-    tbaseline = (acq_stop_dt - acq_start_dt).days
-    if backward_ifg:                                                                # if a backward ifg
-        tbaseline *= (-1)                                                           # t baseline is negative  
-    range_ifg = Range(start = acq_start_dt, end = acq_stop_dt)
-    
-    def_ifg = 0.                                                                                      # initiate
-    sources = []                                                                                            # initiate.  
-    location_polygon = Polygon([])
-    
-    # 1 Add any persistent deformation
-    for persistent_def in persistent_defs:
-        d_start = datetime.strptime(str(persistent_def['def_episode_start']), '%Y%m%d')
-        d_stop = datetime.strptime(str(persistent_def['def_episode_stop']), '%Y%m%d')
-        range_def = Range(start = d_start, end = d_stop)
-        latest_start = max(range_ifg.start, range_def.start)
-        earliest_end = min(range_ifg.end, range_def.end)
-        delta = (earliest_end - latest_start).days
-        overlap = max(0, delta)         
-        # print(f"Overlapping days: {overlap}")                                                                     # can be useful to debug/test
-        if overlap > 0:
-            def_episode = ((overlap / 365.25) * persistent_def['def_rate'])                                      # convert days to years, then multiply by rate in m/year, to get deforamtion in the ifg due to this persistent episode.  
-            if backward_ifg:                                                                                     # but if it's a backward ifg...
-                def_episode *= (-1)                                                                             # signal will be in opposite sense
-            def_ifg += def_episode
-            if persistent_def['source'] not in sources:
-                sources.append(persistent_def['source'])
-            location_polygon_current = Polygon(persistent_def['def_polygon'])
-            location_polygon = unary_union([location_polygon, location_polygon_current])
-                        
-    #print(f"{def_ifg} m")
-    
-    # 2: Add any transient deformation
-    for transient_def in transient_defs:
-        d_start = datetime.strptime(str(transient_def['def_episode_start']), '%Y%m%d')
-        d_stop = datetime.strptime(str(transient_def['def_episode_stop']), '%Y%m%d')
-        range_def = Range(start = d_start, end = d_stop)
-        latest_start = max(range_ifg.start, range_def.start)
-        earliest_end = min(range_ifg.end, range_def.end)
-        delta = (earliest_end - latest_start).days
-        overlap = max(0, delta)
-        #print(f"Overlapping days: {overlap}")                                                                      # can be useful to debug/test
-        if overlap > 0:
-            def_episode = transient_def['def_magnitude']                                                        # 
-            if backward_ifg:                                                                                    # but if it's a backward ifg...
-                def_episode *= (-1)                                                                             # signal will be in opposite sense
-            def_ifg += def_episode
-            if transient_def['source'] not in sources:
-                sources.append(transient_def['source'])
-            location_polygon_current = Polygon(transient_def['def_polygon'])
-            location_polygon = unary_union([location_polygon, location_polygon_current])
-            
-    def_location = polygon_to_list_tuples(location_polygon)
     
+    # 1: the persistent and transient episodes that overlap, from the episode index.  
+    episode_ns, overlaps = overlapping_episodes(label_model, acq_start, acq_stop)
+    overlapping = np.zeros(label_model['def_starts'].shape[0], dtype = bool)
+    overlapping[episode_ns] = True
+    
+    # 2: add the deformation from each overlapping episode
+    def_ifg = 0.                                                                                            # initiate
+    for def_episode in episode_deformations(label_model, overlaps, episode_ns):
+        if backward_ifg:                                                                                    # but if it's a backward ifg...
+            def_episode *= (-1)                                                                             # signal will be in opposite sense
+        def_ifg += float(def_episode)
+    
+    # 3: sources and location, from the cache if this combination of episodes has been seen before.  
+    sources, def_location = label_model_location(label_model, overlapping)
     
     return def_ifg, sources, def_location
 
-#%%
\ No newline at end of file
+#%%
@@ -8,6 +8,9 @@ Created on Tue May  3 12:33:40 2022
 
 import pdb
 
+remapped_colour_maps = {}                                                   # colour maps made by remappedColorMap, keyed by its inputs
+remapped_colour_maps_max = 256                                              # the oldest are removed after this many
+
 #%%
 
 def plot_volcnet_files_labels(volcnet_files, labels_dyke, labels_sill, labels_atmo):
@@ -73,7 +76,8 @@ def plot_volcnet_files_labels(volcnet_files, labels_dyke, labels_sill, labels_at
 #%%
 
 def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, transient_defs, 
-                          acq_spacing = 5, ifg_resolution = 20, figsize_height = 10, labelling_function = None, title = None):
+                          acq_spacing = 5, ifg_resolution = 20, figsize_height = 10, labelling_function = None, title = None, mosaic_tile_rows = 64,
+                          pyramid = None, ifg_cache_size = 64, prefetch = True):
     """Visualise all the possible interferograms that can be formed from a VolcNet time series.  
     
     Inputs:
@@ -111,12 +115,22 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
         acq_spacing | int | every acq_spacing interferogram is shown.  Larger number makes a smaller (and more manageable) figure.  
         ifg_resolution | int | all the interferograms (spaced every acq_spacing) will be displayed as ifg_resolution x ifg_resolution thumbnails.  Note that aspect is destroyed by this, as thumbnails must be square (to ensure x and y time axis are equal)
         figsize_height | int | figure height in inches.  Width is double this.  
+        mosaic_tile_rows | int or None | the thumbnails are made this many rows at a time, so memory use is bounded for long time series (see all_pairs_mosaic).  None makes them all in one go.  
+        pyramid | list of dicts or None | output of volcnet.resampling.open_pyramid for this time series.  If supplied, the thumbnails are made from 
+                                          the smallest level that is big enough, so the full resolution cube isn't read to make them.  
+        ifg_cache_size | int | the interferograms (and their labels) that have been clicked on are kept, so clicking on them again is instant.  Up to this many are kept.  
+        prefetch | boolean | if True, after a click the interferograms either side of it (in the same row and column) are made in a background thread.  
         
     Returns:
-        Figure
+        fig | matplotlib figure | 
         
     History:
         2022_05_03 | MEG | Written.  
+        2026_10_18 | MEG | persistent_defs can also be a volcnet.annotations.Episodes (then transient_defs is not used), which is used to draw the labels.  
+        2026_10_18 | MEG | Make all the thumbnails with all_pairs_mosaic, rather than one at a time.  
+        2026_10_18 | MEG | Downsample by block averaging (optionally from a pyramid), rather than picking pixels.  
+        2026_10_18 | MEG | Cache (and prefetch) the interferograms that are clicked on, and their colour maps.  
+        2026_10_18 | MEG | Return the figure.  
     """
 
     import numpy as np
@@ -126,42 +140,73 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
     from mpl_toolkits.axes_grid1.inset_locator import inset_axes
     import matplotlib.gridspec as gridspec
     import matplotlib.ticker as mticker
-    
-    from volcnet.aux import ll_2_pixel
+    from functools import lru_cache
+    from concurrent.futures import ThreadPoolExecutor
+    
+    from volcnet.aux import ll_2_pixel, dates_to_day_numbers
+    from volcnet.annotations import Episodes
+    from volcnet.resampling import downsample_timeseries
+    
+    @lru_cache(maxsize = ifg_cache_size)
+    def ifg_and_label(acq_primary, acq_secondary):
+        """ Make the ifg between two acquisitions, and its title and label.  No plotting, so can be used in the prefetch thread.  """
+        ifg_array = displacement_r3['cumulative'][acq_primary] - displacement_r3['cumulative'][acq_secondary]                       # make the ifg we are hovering on.  
+        cmap_mid = 1 - ma.max(ifg_array)/(ma.max(ifg_array) + abs(ma.min(ifg_array)))                                               # get the ratio of the data that 0 lies at (eg if data is -15 to 5, ratio is 0.75)
+        
+        primary = datetime.strptime(tbaseline_info['acq_dates'][acq_primary], '%Y%m%d')                                             # to label with the temporal baseline, need to get acquisitions.  
+        secondary = datetime.strptime(tbaseline_info['acq_dates'][acq_secondary], '%Y%m%d')
+        tbaseline = (primary - secondary).days
+        ifg_title = f"{tbaseline_info['acq_dates'][acq_secondary]}_{tbaseline_info['acq_dates'][acq_primary]} ({tbaseline} days)"
+        
+        xys_array = None
+        if labelling_function is not None:
+            ifg_name = f"{tbaseline_info['acq_dates'][acq_secondary]}_{tbaseline_info['acq_dates'][acq_primary]}"                    # get the name of the ifg in yyyymmdd_yyyymmdd
+            def_predicted, sources, def_location = labelling_function(ifg_name, persistent_defs, transient_defs)                     # determine label.
+            ifg_title = ifg_title + f"\n Source(s): {sources} Magnitude: {def_predicted:.2f}m"                                       # add label info to title, deformation is to 2dp.  
+            xys_array = ll_2_pixel(def_location, displacement_r3['lons'], displacement_r3['lats'])                                   # convert lon and lat of deformation to pixel number
+        return ifg_array, cmap_mid, ifg_title, xys_array
+    
+    def colour_map(cmap_mid):
+        """ The colour map for an ifg, which only depends on where 0 is.  """
+        if not np.isfinite(cmap_mid):                                                                                               # e.g. an ifg of all zeros on the diagonal
+            cmap_mid = 0.5
+        cmap_mid = round(float(cmap_mid), 3)                                                                                        # no visible difference, and many more ifgs share a (cached) colour map
+        return remappedColorMap(plt.get_cmap('coolwarm'), start=0.0, midpoint=cmap_mid, stop=1, name='ic_colours_cent')            # make the colours for plotting the ICs
+    
+    def prefetch_neighbours(acq_primary, acq_secondary):
+        """ Make the ifgs either side of the one that was clicked on in the background, so moving along a row or column is instant.  """
+        for acq_primary_next, acq_secondary_next in ((acq_primary + acq_spacing, acq_secondary), (acq_primary - acq_spacing, acq_secondary),
+                                                     (acq_primary, acq_secondary + acq_spacing), (acq_primary, acq_secondary - acq_spacing)):
+            if (0 <= acq_primary_next < n_acq) and (0 <= acq_secondary_next < n_acq):
+                prefetcher.submit(ifg_and_label, acq_primary_next, acq_secondary_next)
     
     def click(event):
         if event.inaxes == ax_all_ifgs:                                                                    # determine if the mouse is in the axes on the left
             if all_ifgs.contains(event):                                                                   # cont is a boolean of if hoving on point, ind is a dictionary about the point being hovered over.  Note that two or more points can be in this.  
                 
                 # 0: clear axes from the previous time we drew a single ifg.  
-                try:
-                    for ax in fig.axes[4:]:                                         
-                        ax.remove()                                                                        # possibly remove the colobar axis so it can be drawn again     
-                except:
-                    pass
+                while len(colorbar_axes) > 0:
+                    colorbar_axes.pop().remove()                                                           # remove the colobar axis so it can be drawn again     
                 ax_1_ifg.clear()                                                                            # and clear the axes to get rid of imshow and plot (for the location information)
                 
-                # 1: Make the ifg that the mouse is hovering on                    
+                # 1: Make (or get from the cache) the ifg that the mouse is hovering on                    
                 acq_primary = int(event.xdata / ifg_resolution) * acq_spacing                                                               # xdata is in pixels of the big image, figure, convert to which acquisition number this is.   
                 acq_secondary = int(event.ydata / ifg_resolution) * acq_spacing                                                             # and in y 
-                #print(f"x:{acq_primary} y:{acq_secondary}")
-                ifg_array = displacement_r3['cumulative'][acq_primary] - displacement_r3['cumulative'][acq_secondary]                       # make the ifg we are hovering on.  
-                cmap_mid = 1 - ma.max(ifg_array)/(ma.max(ifg_array) + abs(ma.min(ifg_array)))                                               # get the ratio of the data that 0 lies at (eg if data is -15 to 5, ratio is 0.75)
-                colours_cent = remappedColorMap(plt.get_cmap('coolwarm'), start=0.0, midpoint=cmap_mid, stop=1, name='ic_colours_cent')     # make the colours for plotting the ICs
-                ifg = ax_1_ifg.imshow(ifg_array, cmap = colours_cent)                                                                       # draw the ifg we are hovering on.  
+                ifg_array, cmap_mid, ifg_title, xys_array = ifg_and_label(acq_primary, acq_secondary)
+                if prefetch:
+                    prefetch_neighbours(acq_primary, acq_secondary)
+                ifg = ax_1_ifg.imshow(ifg_array, cmap = colour_map(cmap_mid))                                                               # draw the ifg we are hovering on.  
                 
                 axins2 = inset_axes(ax_1_ifg, width="100%", height="100%", loc = 'upper left',                                              # what fraction of the bounding box to take up
                                     bbox_to_anchor=(0.05, 0.95, 0.3, 0.05), bbox_transform=ax_1_ifg.transAxes)                              # x start y start x width y height    
+                colorbar_axes.append(axins2)
                 cb = fig.colorbar(ifg, cax = axins2, orientation = 'horizontal')
                 cb.set_label("LOS displacement (m)")
                 
-                # 2: Add the temporal baseline to the figure.  
-                primary = datetime.strptime(tbaseline_info['acq_dates'][acq_primary], '%Y%m%d')                                                     # to label with the temporal baseline, need to get acquisitions.  
-                secondary = datetime.strptime(tbaseline_info['acq_dates'][acq_secondary], '%Y%m%d')
-                tbaseline = (primary - secondary).days
-                ifg_title = f"{tbaseline_info['acq_dates'][acq_secondary]}_{tbaseline_info['acq_dates'][acq_primary]} ({tbaseline} days)"
+                # 2: Add the temporal baseline (and label) to the figure.  
                 ax_1_ifg.set_title(ifg_title)
-
+                if xys_array is not None:
+                    ax_1_ifg.plot(xys_array[:,0], xys_array[:,1] )                                                                   # plot pixel numbers       
                 
                 # 3: update the tick labels to be lon lat
                 xtick_labels = []
@@ -182,15 +227,6 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
                         ytick_labels.append('')
                 ax_1_ifg.yaxis.set_major_locator(mticker.FixedLocator(ax_1_ifg.get_yticks()))
                 ax_1_ifg.yaxis.set_major_formatter(mticker.FixedFormatter(ytick_labels))
-                
-                if labelling_function is not None:
-                    ifg_name = f"{tbaseline_info['acq_dates'][acq_secondary]}_{tbaseline_info['acq_dates'][acq_primary]}"            # get the name of the ifg in yyyymmdd_yyyymmdd
-                    def_predicted, sources, def_location = labelling_function(ifg_name, persistent_defs, transient_defs)             # determine label.
-                    ifg_title = ifg_title + f"\n Source(s): {sources} Magnitude: {def_predicted:.2f}m"                               # add label info to title, deformation is to 2dp.  
-                    ax_1_ifg.set_title(ifg_title)                                                                                    # make label
-                    xys_array = ll_2_pixel(def_location, displacement_r3['lons'], displacement_r3['lats'])                           # convert lon and lat of deformation to pixel number
-                    ax_1_ifg.plot(xys_array[:,0], xys_array[:,1] )                                                                   # plot pixel numbers       
-                    
 
             else:                                                                                                           # else not on a point
                 pass
@@ -198,28 +234,15 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
             pass
         fig.canvas.draw_idle()
     
+    colorbar_axes = []                                                                                      # the axes that click adds, so only these are removed
+    prefetcher = ThreadPoolExecutor(max_workers = 1)                                                       # one thread, so the GUI isn't slowed down
     n_acq, ny, nx = displacement_r3['cumulative'].shape
 
     
     # 1: Create the large figure showing ifgs for each acquisition pair).  
-    cumulative_r3_small = displacement_r3['cumulative'][::acq_spacing,
-                                                        np.array((np.linspace(0, ny-1, ifg_resolution)), dtype = int), :]            # downsample in time and y
-    cumulative_r3_small = cumulative_r3_small[:,:, np.array((np.linspace(0, nx-1, ifg_resolution)), dtype = int)]                    # downsample in x
-    n_acq_plot, ny_plot, nx_plot = cumulative_r3_small.shape                                                                         # 
-    figure = ma.zeros((n_acq_plot * ifg_resolution, n_acq_plot * ifg_resolution))                                                    # create a giant ma array of zeros to hold all the one channel images.  
-
-    print("Row", end = '')
-    for row_n in range(n_acq_plot):                                                                                                  # loop down one row.  
-        print(f" {row_n}", end = '')
-        cumulative_r3_small -= cumulative_r3_small[row_n,]                                                                           # make the time series relative to this acquisition number.  
-        for col_n in range(n_acq_plot):
-            if col_n == row_n:                                                                                                       # if on the diagonal, make a square of zeros so it stands out
-                mini_ifg = ma.array(np.zeros((ny_plot, nx_plot)), mask = np.zeros((ny_plot, nx_plot)))
-            else:
-                mini_ifg = cumulative_r3_small[col_n,]                                                                              # for all others just get the ifg.  
-            figure[row_n*ifg_resolution : (row_n + 1) *ifg_resolution,  
-                   col_n*ifg_resolution : (col_n + 1) *ifg_resolution,] = mini_ifg                                                  # put the ifg in the correct place on the giant figure.              
-    print('\n')
+    cumulative_r3_small = downsample_timeseries(displacement_r3['cumulative'], ifg_resolution, ifg_resolution, pyramid,              # downsample in time, and block average in y and x
+                                                acq_ns = slice(None, None, acq_spacing))
+    figure = all_pairs_mosaic(cumulative_r3_small, mosaic_tile_rows)                                                                # the giant ma array of all the one channel images.  
             
     
 
@@ -235,6 +258,7 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
     all_ifgs = ax_all_ifgs.imshow(figure)                                                                                              # plot the giant overview of tiny interferograms.  
 
     fig.canvas.mpl_connect("button_press_event", click)                                                                                 # connect the figure and the function, note that done when the mouse clicks.  
+    fig.canvas.mpl_connect("close_event", lambda event: prefetcher.shutdown(wait = False, cancel_futures = True))                     # stop prefetching when the figure is closed.  
     ax_all_ifgs.set_xlabel('Primary acquisition')
     ax_all_ifgs.set_ylabel('Secondary acquisition')
     # Set the tick labels to be in dates and not pixels of the giant figure.  
@@ -268,22 +292,17 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
     fig.add_subplot(ax_labels)                                                                   # add to figure
     ax_transient = ax_labels.twinx()
     
-    d0_dt = datetime.strptime(tbaseline_info['acq_dates'][0], '%Y%m%d')
+    d0 = dates_to_day_numbers(tbaseline_info['acq_dates'][:1])[0]
     ax_labels.set_xlim(tbaseline_info['baselines_cumulative'][0], tbaseline_info['baselines_cumulative'][-1])
     
     colour_persistnet = 'tab:orange'
     colour_transient = 'tab:blue'
     
-    for persistent_def in persistent_defs:
-        x_start = (datetime.strptime(str(persistent_def["def_episode_start"]), '%Y%m%d') - d0_dt).days
-        x_stop = (datetime.strptime(str(persistent_def["def_episode_stop"]), '%Y%m%d') - d0_dt).days
-        ax_transient.plot((x_start, x_stop), (persistent_def["def_rate"], persistent_def["def_rate"]), c = colour_persistnet)
-        
-    for transient_def in transient_defs:
-
-        x_start = (datetime.strptime(str(transient_def["def_episode_start"]), '%Y%m%d') - d0_dt).days
-        x_stop = (datetime.strptime(str(transient_def["def_episode_stop"]), '%Y%m%d') - d0_dt).days
-        ax_transient.plot((x_start, x_stop), (transient_def["def_magnitude"], transient_def["def_magnitude"]), c = colour_transient)
+    episodes = Episodes.from_labels(persistent_defs, transient_defs)
+    x_starts = episodes.starts - d0                                                                                 # days since the first acquisition
+    x_stops = episodes.stops - d0
+    for x_start, x_stop, persistent, value in zip(x_starts, x_stops, episodes.persistent, episodes.values):
+        ax_transient.plot((x_start, x_stop), (value, value), c = colour_persistnet if persistent else colour_transient)
 
 
     xticks_every_nmonths(ax_labels, tbaseline_info['acq_dates'][0], tbaseline_info['baselines_cumulative'], include_tick_labels = True,                  # update x ticks, but with labels.  
@@ -296,9 +315,206 @@ def volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, tran
     if title is not None:
         fig.suptitle(title)
         fig.canvas.manager.set_window_title(title)
+    
+    return fig
                 
 
 
+#%%
+
+def render_volcnet_overviews(volcnet_files, outdir, n_processes = 4, acq_spacing = 1, ifg_resolution = 20, figsize_height = 10, 
+                             use_pyramid = True, dpi = 100):
+    """ Save the overview figure of volcnet_ts_visualiser (the interferograms between every pair of acquisitions, and the labels) for each
+    VolcNet file as a .png, without displaying anything (i.e. using the Agg backend), with the files split across a pool of processes.  
+    The data, labels and settings each .png was made from are recorded in overview_stamps.json in outdir, and a file is only rendered again 
+    if one of these has changed (or its .png has been deleted), so rerunning after e.g. editing the labels of one file is quick.  
+    Each file's stamp is recorded as soon as its .png has been saved, so an interrupted run only has to render the files that hadn't finished.  
+    A file that can't be rendered (e.g. it's corrupt) doesn't stop the others, and is reported at the end (and rendered again next time).  
+    
+    Inputs:
+        volcnet_files | list of strings or pathlib Paths | .pkl files or .volcnet directories.  
+        outdir | string or pathlib Path | the .pngs are saved here, named after each file (<file name>_overview.png).  Made if it doesn't exist.  
+        n_processes | int | number of processes to use.  
+        acq_spacing | int | see volcnet_ts_visualiser
+        ifg_resolution | int | see volcnet_ts_visualiser
+        figsize_height | int | see volcnet_ts_visualiser
+        use_pyramid | boolean | if True, the thumbnails are made from the pyramid of each file (see volcnet.resampling.open_pyramid), which is made the first time.  
+        dpi | int | of the .pngs
+        
+    Returns:
+        png_files | list of pathlib Paths | the .png of each file, in the same order as volcnet_files.  
+        failed_files | list | the volcnet files that couldn't be rendered this time.  
+        
+    History:
+        2026_10_18 | MEG | Written.  
+        2026_10_18 | MEG | Record each stamp when its file has been rendered, and carry on (and report) if a file can't be rendered.  
+    """
+    import json
+    import multiprocessing
+    from pathlib import Path
+    
+    outdir = Path(outdir)
+    outdir.mkdir(parents = True, exist_ok = True)
+    stamps_file = outdir / 'overview_stamps.json'
+    if stamps_file.exists():
+        with open(stamps_file, 'r') as f:
+            stamps = json.load(f)
+    else:
+        stamps = {}
+    settings = [acq_spacing, ifg_resolution, figsize_height, use_pyramid, dpi]
+    
+    # 1: work out which files need rendering.  
+    png_files = []
+    tasks = []
+    for volcnet_file in volcnet_files:
+        png_file = outdir / f"{Path(volcnet_file).name}_overview.png"                                       # e.g. <name>.pkl_overview.png, so a .pkl file and .volcnet directory of the same name don't clash
+        stamp = overview_stamp(volcnet_file) + [settings]
+        png_files.append(png_file)
+        if (stamps.get(png_file.name) != stamp) or (not png_file.exists()):
+            tasks.append((volcnet_file, png_file, stamp, acq_spacing, ifg_resolution, figsize_height, use_pyramid, dpi))      # stamp from before rendering, so any change during it is rendered next time
+            stamps.pop(png_file.name, None)                                                                 # removed until it's been rendered
+        else:
+            print(f"{png_file.name} is up to date.  ")
+    
+    # 2: render them, recording the stamp of each file as soon as it's done.  
+    print(f"Rendering {len(tasks)} of {len(volcnet_files)} overviews with {n_processes} processes.  ")
+    failed_files = []
+    if len(tasks) > 0:
+        write_overview_stamps(stamps_file, stamps)                                                         # without the stamps of the files that are about to be rendered
+        with multiprocessing.Pool(n_processes) as pool:
+            for task_n, error in pool.imap_unordered(try_render_volcnet_overview, enumerate(tasks)):        # in the order they finish
+                volcnet_file, png_file, stamp = tasks[task_n][:3]
+                if error is None:
+                    stamps[png_file.name] = stamp
+                    write_overview_stamps(stamps_file, stamps)
+                else:
+                    print(f"Unable to render {Path(volcnet_file).name}: {error}")
+                    failed_files.append(volcnet_file)
+    if len(failed_files) > 0:
+        print(f"{len(failed_files)} overviews couldn't be rendered: {[Path(failed_file).name for failed_file in failed_files]}")
+    return png_files, failed_files
+
+
+#%%
+
+def try_render_volcnet_overview(task_n_and_task):
+    """ Call render_volcnet_overview, but return any error rather than raising it, so one bad file doesn't stop render_volcnet_overviews.  
+    Inputs:
+        task_n_and_task | tuple | task number, and (volcnet_file, png_file, stamp, and the rest of the arguments of render_volcnet_overview).  
+    Returns:
+        task_n | int | as input.  
+        error | string or None | the error, if the file couldn't be rendered.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    task_n, (volcnet_file, png_file, stamp, *render_args) = task_n_and_task
+    try:
+        render_volcnet_overview(volcnet_file, png_file, *render_args)
+        return task_n, None
+    except Exception as error:
+        return task_n, f"{type(error).__name__}: {error}"
+
+
+#%%
+
+def write_overview_stamps(stamps_file, stamps):
+    """ Write overview_stamps.json (see render_volcnet_overviews) to a temporary file which then replaces it, so an interrupted write can't leave a 
+    broken file.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    import json
+    
+    stamps_file_tmp = stamps_file.with_name(stamps_file.name + '_tmp')
+    with open(stamps_file_tmp, 'w') as f:
+        json.dump(stamps, f, indent = 1)
+    stamps_file_tmp.replace(stamps_file)
+
+
+#%%
+
+def render_volcnet_overview(volcnet_file, png_file, acq_spacing, ifg_resolution, figsize_height, use_pyramid, dpi):
+    """ Save the overview figure of one VolcNet file as a .png.  Used by render_volcnet_overviews, in a separate process.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    from pathlib import Path
+    import matplotlib.pyplot as plt
+    
+    from volcnet.file_handling import open_volcnet_file
+    from volcnet.resampling import open_pyramid
+    
+    plt.switch_backend('Agg')                                                                               # no display
+    displacement_r3, tbaseline_info, persistent_defs, transient_defs = open_volcnet_file(volcnet_file)
+    if use_pyramid:
+        pyramid = open_pyramid(volcnet_file, displacement_r3)
+    else:
+        pyramid = None
+    fig = volcnet_ts_visualiser(displacement_r3, tbaseline_info, persistent_defs, transient_defs, acq_spacing = acq_spacing, ifg_resolution = ifg_resolution, 
+                                figsize_height = figsize_height, title = Path(volcnet_file).name.split('.')[0], pyramid = pyramid, prefetch = False)
+    fig.savefig(png_file, dpi = dpi)
+    plt.close(fig)
+    print(f"Saved {png_file.name}")
+
+
+#%%
+
+def overview_stamp(volcnet_file):
+    """ Size and modification time of everything an overview figure is made from, i.e. the .pkl file, or the header.json (labels) and arrays 
+    of a .volcnet directory.  
+    History:
+        2026_10_18 | MEG | Written.  
+    """
+    from pathlib import Path
+    
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        source_files = [volcnet_file / 'header.json'] + sorted(volcnet_file.glob('*.npy'))
+    else:
+        source_files = [volcnet_file]
+    return [[source_file.name, source_file.stat().st_size, source_file.stat().st_mtime_ns] for source_file in source_files]
+
+
+#%%
+
+def all_pairs_mosaic(cumulative_r3_small, tile_rows = 64):
+    """ Make the image of the interferograms between every pair of acquisitions of a (downsampled) time series, as used by volcnet_ts_visualiser.  
+    The thumbnail in row r and column c is cumulative[c] - cumulative[r], and the thumbnails on the diagonal are zeros (and not masked) so they stand out.  
+    
+    Inputs:
+        cumulative_r3_small | rank 3 ma | n_acq x ny x nx cumulative displacement.  
+        tile_rows | int or None | the thumbnails are made this many rows at a time (so at most tile_rows x n_acq thumbnails are in memory
+                                  at once, as well as the image), or all in one go if None.  
+    Returns:
+        figure | rank 2 ma | (n_acq x ny) x (n_acq x nx) image of all the thumbnails.  
+    History:
+        2026_10_18 | MEG | Written, from volcnet_ts_visualiser.  
+    """
+    import numpy as np
+    import numpy.ma as ma
+    
+    n_acq, ny, nx = cumulative_r3_small.shape
+    if tile_rows is None:
+        tile_rows = max(n_acq, 1)
+    data = ma.getdata(cumulative_r3_small).astype(float)
+    mask = ma.getmaskarray(cumulative_r3_small)
+    figure_data = np.zeros((n_acq * ny, n_acq * nx))
+    figure_mask = np.zeros((n_acq * ny, n_acq * nx), dtype = bool)
+    
+    for row_start in range(0, n_acq, tile_rows):
+        row_stop = min(row_start + tile_rows, n_acq)
+        tile_data = data[np.newaxis, :] - data[row_start:row_stop, np.newaxis]                                  # rows x cols x ny x nx, so [r, c] is cumulative[c] - cumulative[r]
+        tile_mask = mask[np.newaxis, :] | mask[row_start:row_stop, np.newaxis]
+        row_ns = np.arange(row_start, row_stop)
+        tile_data[row_ns - row_start, row_ns] = 0.                                                               # the diagonal is zeros so it stands out
+        tile_mask[row_ns - row_start, row_ns] = False
+        figure_rows = slice(row_start * ny, row_stop * ny)
+        figure_data[figure_rows] = tile_data.transpose(0, 2, 1, 3).reshape((row_stop - row_start) * ny, n_acq * nx)    # thumbnails side by side in each row
+        figure_mask[figure_rows] = tile_mask.transpose(0, 2, 1, 3).reshape((row_stop - row_start) * ny, n_acq * nx)
+    
+    return ma.masked_array(figure_data, mask = figure_mask)
+
+
 ########################################################################################################################################
 ########################################################################################################################################
 ########################################################################################################################################
@@ -439,30 +655,36 @@ def remappedColorMap(cmap, start=0, midpoint=0.5, stop=1.0, name='shiftedcmap'):
       2017/??/?? | taken from stack exchange
       2017/10/11 | update so that crops shorter side of colorbar (so if data are in range [-1 100],
                    100 will be dark red, and -1 slightly blue (and not dark blue))
+      2026/10/18 | get all the colours in one call to cmap, and cache the colour maps (keyed by cmap.name, start, midpoint, stop and name),
+                   so the same colour map object is returned each time (so it shouldn't be modified).  
       '''
     import numpy as np
     import matplotlib
     import matplotlib.pyplot as plt
 
+    cmap_key = (cmap.name, start, midpoint, stop, name)
+    if cmap_key in remapped_colour_maps:
+        return remapped_colour_maps[cmap_key]
+
     if midpoint > 0.5:                                      # crop the top or bottom of the colourscale so it's not asymetric.
         stop=(0.5 + (1-midpoint))
     else:
         start=(0.5 - midpoint)
 
-
-    cdict = { 'red': [], 'green': [], 'blue': [], 'alpha': []  }
     # regular index to compute the colors
     reg_index = np.hstack([np.linspace(start, 0.5, 128, endpoint=False),  np.linspace(0.5, stop, 129)])
 
     # shifted index to match the data
     shift_index = np.hstack([ np.linspace(0.0, midpoint, 128, endpoint=False), np.linspace(midpoint, 1.0, 129)])
 
-    for ri, si in zip(reg_index, shift_index):
-        r, g, b, a = cmap(ri)
-        cdict['red'].append((si, r, r))
-        cdict['green'].append((si, g, g))
-        cdict['blue'].append((si, b, b))
-        cdict['alpha'].append((si, a, a))
+    colours = cmap(reg_index)                                                               # 257 x 4 (r, g, b, a), all at once
+    cdict = {}
+    for colour_n, colour_name in enumerate(['red', 'green', 'blue', 'alpha']):
+        cdict[colour_name] = np.stack([shift_index, colours[:, colour_n], colours[:, colour_n]], axis = 1)        # rows of (x, y0, y1), as in a list of tuples
     newcmap = matplotlib.colors.LinearSegmentedColormap(name, cdict)
     #plt.register_cmap(cmap=newcmap)
+    
+    if len(remapped_colour_maps) >= remapped_colour_maps_max:
+        del remapped_colour_maps[next(iter(remapped_colour_maps))]                          # remove the oldest
+    remapped_colour_maps[cmap_key] = newcmap
     return newcmap
\ No newline at end of file
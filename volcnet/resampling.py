@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:37 2026
+
+@author: matthew
+
+Resampling VolcNet time series onto a larger grid (for when a time series is smaller than the interferograms being made from it),
+or a smaller one (for thumbnails).
+
+The interpolation is separable (along y, then along x) and linear, and done for every acquisition at once.  As it's done with
+the corners of the grid aligned, the lons and lats of a regular grid are interpolated exactly.  The rescaled time series is
+cached alongside the VolcNet file for each output size, so files that are reopened aren't rescaled again.
+
+Downsampling averages the unmasked pixels in each block.  A pyramid of block averaged versions of each time series (each half
+the size of the last) can be cached alongside the VolcNet file, so thumbnails only need to read a small level.
+"""
+
+import pdb
+
+#%%
+
+def rescale_timeseries(displacement_r3, rescale_factor):
+    """ Rescale every array in a VolcNet time series (i.e. the cumulative cube, mask, lons, lats and dem) in one go.
+    Masked pixels are not used when interpolating the pixels around them, and a new pixel is masked if it's mostly
+    interpolated from masked pixels.
+
+    Inputs:
+        displacement_r3 | dict | as returned by volcnet.file_handling.open_volcnet_file.  Anything that isn't an array with
+                                 the same last two dimensions as lons is passed through unchanged.
+        rescale_factor | float | new size is the old size multiplied by this (and rounded).
+
+    Returns:
+        displacement_r3_rescaled | dict | with the same keys and types as displacement_r3.
+
+    History:
+        2026_10_18 | MEG | Written, to replace deep_learning_tools.data_handling.rescale_timeseries.
+    """
+    import numpy as np
+
+    ny, nx = displacement_r3['lons'].shape
+    ny_new = max(int(np.round(ny * rescale_factor)), 2)
+    nx_new = max(int(np.round(nx * rescale_factor)), 2)
+    y_weights = interpolation_weights(ny, ny_new)                                                         # the same for every array, so only calculated once
+    x_weights = interpolation_weights(nx, nx_new)
+
+    displacement_r3_rescaled = {}
+    for key, value in displacement_r3.items():
+        if isinstance(value, np.ndarray) and (value.ndim >= 2) and (value.shape[-2:] == (ny, nx)):
+            displacement_r3_rescaled[key] = rescale_array(value, y_weights, x_weights)
+        else:
+            displacement_r3_rescaled[key] = value
+    return displacement_r3_rescaled
+
+
+#%%
+
+def interpolation_weights(n_in, n_out):
+    """ For linear interpolation along one axis from n_in to n_out pixels (with the first and last pixels aligned), the two input pixels
+    each output pixel is made from, and the weight of the second.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+
+    positions = np.arange(n_out) * ((n_in - 1) / max(n_out - 1, 1))                                      # position of each output pixel, in input pixels
+    pixels_0 = np.minimum(np.floor(positions).astype(int), max(n_in - 2, 0))                              # so pixels_1 is never off the end
+    pixels_1 = np.minimum(pixels_0 + 1, n_in - 1)
+    weights_1 = positions - pixels_0
+    return pixels_0, pixels_1, weights_1
+
+
+#%%
+
+def rescale_array(array, y_weights, x_weights):
+    """ Linearly interpolate the last two dimensions of an array (for all other dimensions at once), using the outputs of interpolation_weights.
+    Masked arrays are interpolated using only the unmasked pixels, and boolean arrays are thresholded back to booleans.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    import numpy.ma as ma
+
+    def interpolate(data):
+        """ Separable linear interpolation, along y then x.  """
+        pixels_0, pixels_1, weights_1 = y_weights
+        weights_1 = weights_1[:, np.newaxis]                                                              # broadcast along x
+        data = (1 - weights_1) * data[..., pixels_0, :] + weights_1 * data[..., pixels_1, :]
+        pixels_0, pixels_1, weights_1 = x_weights
+        data = (1 - weights_1) * data[..., pixels_0] + weights_1 * data[..., pixels_1]
+        return data
+
+    if isinstance(array, ma.MaskedArray):
+        valid = np.logical_not(ma.getmaskarray(array)).astype(np.result_type(array.dtype, np.float32))           # same precision as the data
+        valid_interp = interpolate(valid)
+        data_interp = interpolate(ma.filled(array, 0.) * valid) / np.maximum(valid_interp, 1e-6)           # weighted only by the unmasked pixels
+        return ma.masked_array(data_interp.astype(array.dtype), mask = valid_interp < 0.5)
+    elif array.dtype == bool:
+        return interpolate(array.astype(np.float32)) >= 0.5
+    else:
+        return interpolate(np.asarray(array)).astype(array.dtype)
+
+
+#%%
+
+def open_rescaled_timeseries(volcnet_file, displacement_r3, rescale_factor):
+    """ Rescale a VolcNet time series, or get it from the cache saved alongside the file if it's been rescaled by the same factor before.
+    The cache is remade if the pixel data of the VolcNet file have changed since it was made (see pixel_data_stamp), but not if only the 
+    labels have changed.  
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory that displacement_r3 is from.
+        displacement_r3 | dict | as returned by volcnet.file_handling.open_volcnet_file.
+        rescale_factor | float | see rescale_timeseries
+
+    Returns:
+        displacement_r3_rescaled | dict | see rescale_timeseries
+
+    History:
+        2026_10_18 | MEG | Written.
+        2026_10_18 | MEG | Key the cache on the pixel data rather than the whole file, and write it to a temporary file for each process.  
+    """
+    import os
+    import zipfile
+    import numpy as np
+    import numpy.ma as ma
+
+    from volcnet.file_handling import rescaled_path
+
+    ny, nx = displacement_r3['lons'].shape
+    ny_new = max(int(np.round(ny * rescale_factor)), 2)
+    nx_new = max(int(np.round(nx * rescale_factor)), 2)
+    cache_file = rescaled_path(volcnet_file, ny_new, nx_new)
+    source_stamp = pixel_data_stamp(volcnet_file, displacement_r3)                                         # the cache is only valid for this version of the pixel data
+
+    if cache_file.exists():
+        try:
+            with np.load(cache_file) as cache:
+                if str(cache['source_stamp']) == source_stamp:
+                    displacement_r3_rescaled = dict(displacement_r3)                                       # anything that isn't rescaled is passed through
+                    for key in cache.files:
+                        if key == 'source_stamp' or key.endswith('__mask'):
+                            continue
+                        if f"{key}__mask" in cache.files:
+                            displacement_r3_rescaled[key] = ma.masked_array(cache[key], mask = cache[f"{key}__mask"])
+                        else:
+                            displacement_r3_rescaled[key] = cache[key]
+                    print(f"Rescaled time series loaded from {cache_file.name}.  ")
+                    return displacement_r3_rescaled
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            print(f"Unable to read {cache_file.name}, so it will be recreated.  ")
+
+    displacement_r3_rescaled = rescale_timeseries(displacement_r3, rescale_factor)
+    cache = {'source_stamp' : np.array(source_stamp)}
+    for key, value in displacement_r3_rescaled.items():
+        if value is displacement_r3.get(key):                                                              # not rescaled, so don't need to be cached
+            continue
+        if isinstance(value, ma.MaskedArray):
+            cache[key] = ma.getdata(value)
+            cache[f"{key}__mask"] = ma.getmaskarray(value)
+        else:
+            cache[key] = value
+    cache_file_tmp = cache_file.with_name(f"{cache_file.name}_tmp_{os.getpid()}.npz")                    # each process has its own temporary file
+    try:
+        np.savez(cache_file_tmp, **cache)
+        cache_file_tmp.replace(cache_file)                                                                 # so an interrupted write can't leave a broken cache
+    except OSError:
+        print(f"Unable to write {cache_file}, so the time series will be rescaled again next time.  ")
+        cache_file_tmp.unlink(missing_ok = True)
+    return displacement_r3_rescaled
+
+
+#%%
+
+def pixel_data_stamp(volcnet_file, displacement_r3):
+    """ A string that changes if the pixel data of a VolcNet file change, but not if only its labels change.  For a .volcnet directory this 
+    is the size and modification time of its arrays (as in volcnet.plotting.overview_stamp, but without header.json).  The arrays of a .pkl 
+    file are in the same file as the labels, so for these it's a hash of the arrays in displacement_r3 (which have already been read).  
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory that displacement_r3 is from.
+        displacement_r3 | dict | as returned by volcnet.file_handling.open_volcnet_file.
+    Returns:
+        source_stamp | string | json of the stamp.  
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import hashlib
+    import json
+    import numpy as np
+    import numpy.ma as ma
+    from pathlib import Path
+
+    volcnet_file = Path(volcnet_file)
+    if volcnet_file.is_dir():
+        arrays_stamp = array_files_stat(volcnet_file)
+    else:
+        arrays_hash = hashlib.sha1()
+        for key in sorted(displacement_r3):
+            if isinstance(displacement_r3[key], np.ndarray):
+                for array in [ma.getdata(displacement_r3[key]), ma.getmaskarray(displacement_r3[key])]:
+                    arrays_hash.update(f"{key}_{array.dtype}_{array.shape}".encode())
+                    arrays_hash.update(np.ascontiguousarray(array).data)
+        arrays_stamp = [volcnet_file.name, arrays_hash.hexdigest()]
+    return json.dumps([arrays_stamp, list(displacement_r3['lons'].shape)])
+
+
+#%%
+
+def array_files_stat(volcnet_dir):
+    """ Name, size and modification time (ns) of each array (.npy file) of a .volcnet directory, i.e. of its pixel data but not its labels 
+    (header.json).  
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    from pathlib import Path
+
+    return [[array_file.name, array_file.stat().st_size, array_file.stat().st_mtime_ns] for array_file in sorted(Path(volcnet_dir).glob('*.npy'))]
+
+
+#%%
+
+def bin_mean(data, counts, y_edges, x_edges):
+    """ Mean of the pixels in each bin of the last two dimensions of an array, weighted by how many (full resolution) pixels each pixel
+    is the mean of (so masked pixels, with a count of 0, are not used).  Bins can be of different sizes, so this can downsample by any amount.
+
+    Inputs:
+        data | rank 2 or more array | e.g. n_acq x ny x nx.  Values of pixels with a count of 0 are not used.
+        counts | array that broadcasts against data | number of full resolution pixels each pixel is the mean of.  Unmasked pixels
+                                                      of the full resolution data are 1, masked pixels are 0.
+        y_edges | rank 1 int | first pixel of each bin in y (so the first is 0)
+        x_edges | rank 1 int | as above, but in x.
+
+    Returns:
+        data_binned | array | mean of each bin, 0 where there are no unmasked pixels.
+        counts_binned | array | number of full resolution pixels each bin is the mean of.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+
+    counts = np.broadcast_to(counts, data.shape)
+    sums = np.add.reduceat(np.add.reduceat(np.where(counts > 0, data * counts, 0.), y_edges, axis = -2), x_edges, axis = -1)
+    counts_binned = np.add.reduceat(np.add.reduceat(counts.astype(np.int64), y_edges, axis = -2), x_edges, axis = -1)
+    data_binned = sums / np.maximum(counts_binned, 1)
+    return data_binned, counts_binned
+
+
+#%%
+
+def downsample_timeseries(cumulative, ny_out, nx_out, pyramid = None, acq_ns = slice(None)):
+    """ Downsample a cumulative displacement cube (for thumbnails) by averaging the unmasked pixels in blocks, rather than picking single
+    pixels, which aliases noisy data.  If a pyramid is supplied, the smallest level that is still at least ny_out x nx_out is used, so
+    the full resolution cube doesn't need to be read.
+
+    Inputs:
+        cumulative | rank 3 ma | n_acq x ny x nx cumulative displacement, at full resolution.
+        ny_out | int | size of the output.
+        nx_out | int | as above.
+        pyramid | list of dicts or None | output of open_pyramid for this time series.
+        acq_ns | slice or rank 1 int | acquisitions to downsample, e.g. slice(None, None, 5) for every 5th.
+
+    Returns:
+        cumulative_small | rank 3 ma | n_acq x ny_out x nx_out, masked where a block has no unmasked pixels.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    import numpy.ma as ma
+
+    source = None
+    for level in (pyramid if pyramid is not None else []):                                                   # levels get smaller, so the last that is big enough
+        if (level['cumulative'].shape[1] >= ny_out) and (level['cumulative'].shape[2] >= nx_out):
+            source = level
+
+    if source is not None:
+        data = np.asarray(source['cumulative'][acq_ns], dtype = float)                                       # only the acquisitions needed are read (as memory mapped)
+        counts = np.asarray(source['counts'][acq_ns])
+    else:
+        cumulative = cumulative[acq_ns]
+        data = np.asarray(ma.getdata(cumulative), dtype = float)
+        counts = np.logical_not(ma.getmaskarray(cumulative))
+    ny, nx = data.shape[1:]
+    y_edges = np.linspace(0, ny, ny_out + 1).astype(int)[:-1]                                                 # if the output is larger, some pixels are just repeated
+    x_edges = np.linspace(0, nx, nx_out + 1).astype(int)[:-1]
+    data_small, counts_small = bin_mean(data, counts, y_edges, x_edges)
+    return ma.masked_array(data_small, mask = counts_small == 0)
+
+
+#%%
+
+def build_pyramid(cumulative, min_size = 16):
+    """ Make block averaged (2 x 2 pixels, ignoring masked pixels) versions of a cumulative displacement cube, each half the size of the last,
+    until they would be smaller than min_size.
+
+    Inputs:
+        cumulative | rank 3 ma | n_acq x ny x nx cumulative displacement, at full resolution.
+        min_size | int | the smallest level is at least this many pixels in y and x.
+
+    Returns:
+        pyramid | list of dicts | one per level, largest first.  Each contains:
+                                    downsample | int | the pixels of this level are downsample x downsample full resolution pixels.
+                                    cumulative | n_acq x ny x nx float32 | mean of the unmasked pixels in each block.
+                                    counts | n_acq x ny x nx uint32 | number of unmasked full resolution pixels in each block.
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import numpy as np
+    import numpy.ma as ma
+
+    pyramid = []
+    data = ma.getdata(cumulative)
+    counts = np.logical_not(ma.getmaskarray(cumulative))
+    downsample = 1
+    while min(data.shape[1:]) >= 2 * min_size:
+        ny, nx = data.shape[1:]
+        data, counts = bin_mean(np.asarray(data, dtype = float), counts, np.arange(0, ny, 2), np.arange(0, nx, 2))      # each level is made from the last, weighted by the counts so it's exact
+        downsample *= 2
+        pyramid.append({'downsample' : downsample,
+                        'cumulative' : data.astype(np.float32),
+                        'counts'     : counts.astype(np.uint32)})
+    return pyramid
+
+
+#%%
+
+def open_pyramid(volcnet_file, displacement_r3 = None, min_size = 16):
+    """ Get the pyramid of a VolcNet file from the cache saved alongside it (memory mapped, so only the levels and acquisitions
+    that are used are read), or make it and save it if it doesn't exist or the file has changed.  For a .volcnet directory, only changes to 
+    its arrays (not to header.json, which holds the labels) mean the pyramid is made again.  
+
+    Inputs:
+        volcnet_file | string or pathlib Path | .pkl file or .volcnet directory.
+        displacement_r3 | dict or None | from the file, if it's already open.  Only needed if the pyramid has to be made.
+        min_size | int | see build_pyramid
+
+    Returns:
+        pyramid | list of dicts | see build_pyramid.
+
+    History:
+        2026_10_18 | MEG | Written.
+        2026_10_18 | MEG | Key the pyramid of a .volcnet directory on its arrays rather than header.json.  
+    """
+    import json
+    import shutil
+    import numpy as np
+    from pathlib import Path
+
+    from volcnet.file_handling import pyramid_path, open_volcnet_file
+    from volcnet.label_index import volcnet_file_stat
+
+    pyramid_dir = pyramid_path(volcnet_file)
+    if Path(volcnet_file).is_dir():
+        file_stat = array_files_stat(volcnet_file) + [min_size]                                              # the pyramid is only valid for this version of the pixel data
+    else:
+        file_stat = volcnet_file_stat(volcnet_file) + [min_size]                                             # the pixel data and labels are in one file, so any change remakes it
+
+    header_file = pyramid_dir / 'pyramid.json'
+    if header_file.exists():
+        with open(header_file, 'r') as f:
+            header = json.load(f)
+        if header['source_stat'] == file_stat:
+            pyramid = []
+            for level_n, downsample in enumerate(header['downsamples']):
+                pyramid.append({'downsample' : downsample,
+                                'cumulative' : np.load(pyramid_dir / f"level_{level_n}.npy", mmap_mode = 'r'),
+                                'counts'     : np.load(pyramid_dir / f"level_{level_n}_counts.npy", mmap_mode = 'r')})
+            return pyramid
+
+    if displacement_r3 is None:
+        displacement_r3, _, _, _ = open_volcnet_file(volcnet_file)
+    print(f"Making the pyramid of {str(volcnet_file).split('/')[-1]}, and saving to {pyramid_dir}")
+    pyramid = build_pyramid(displacement_r3['cumulative'], min_size)
+    try:
+        shutil.rmtree(pyramid_dir, ignore_errors = True)
+        pyramid_dir.mkdir(parents = True)
+        for level_n, level in enumerate(pyramid):
+            np.save(pyramid_dir / f"level_{level_n}.npy", level['cumulative'])
+            np.save(pyramid_dir / f"level_{level_n}_counts.npy", level['counts'])
+        with open(header_file, 'w') as f:                                                                    # written last, so the pyramid is only used if it's complete
+            json.dump({'source_stat' : file_stat,
+                       'downsamples' : [level['downsample'] for level in pyramid]}, f, indent = 1)
+    except OSError:
+        print(f"Unable to write {pyramid_dir}, so the pyramid will be made again next time.  ")
+    return pyramid
+
+
+#%%
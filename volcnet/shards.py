@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:40:07 2026
+
+@author: matthew
+
+Writing (and reading) the labelled interferograms made by create_volcnet_ifgs to shards (i.e. files of n_data_per_file data).
+
+Shards can be in one of two formats:
+    pkl | <stem>_00000.pkl | X (masked array), Y_class, Y_loc pickled in sequence, all float64.
+    npy | <stem>_00000_X.npy | X as float32, with masked pixels set to fill_value.
+          <stem>_00000_mask.npy | the mask of X, packed to bits (uint8), one row per datum.
+          <stem>_00000_Y_class.npy | uint8
+          <stem>_00000_Y_loc.npy | float32
+      The npy format is several times smaller and faster to write and read, and can be memory mapped.
+"""
+
+import pdb
+
+#%%
+
+class ShardWriter():
+    """ Accumulate crops and their labels, and write them to a shard each time n_data_per_file have been accumulated.
+    Data that don't fit in the current shard are carried over to the next one, the final partial shard is written when the writer is
+    closed, and a manifest (<outfile_stem>_manifest.json) records how many data are in each shard.
+
+    Usage:
+        shard_writer = ShardWriter(outdir, 'data_file_unshuffled', 100, shard_format = 'npy')
+        shard_writer.add(X, Y_class, Y_loc)                 # as many times as needed
+        shard_writer.close()
+
+    History:
+        2026_10_18 | MEG | Written.
+        2026_10_18 | MEG | Add the npy format.
+    """
+
+    def __init__(self, outdir, outfile_stem = 'data_file_unshuffled', n_data_per_file = 100, shard_format = 'pkl', fill_value = 0.):
+        """
+        Inputs:
+            outdir | pathlib Path | out directory.
+            outfile_stem | string | shards are named <outfile_stem>_00000.pkl etc.
+            n_data_per_file | int | number of data per shard (the last shard may have fewer).
+            shard_format | string | 'pkl' or 'npy'.  See the top of this module.
+            fill_value | float | value of masked pixels in X for the npy format.
+        """
+        from pathlib import Path
+
+        if shard_format not in ['pkl', 'npy']:
+            raise Exception(f"shard_format must be either 'pkl' or 'npy', but is {shard_format}.  Exiting.  ")
+
+        self.outdir = Path(outdir)
+        self.outfile_stem = outfile_stem
+        self.n_data_per_file = n_data_per_file
+        self.shard_format = shard_format
+        self.fill_value = fill_value
+        self.shards = []                                                        # file name and number of data in each shard written.
+        self.data_n = 0                                                         # number of data currently in the buffer
+        self.X = None                                                           # buffers are made on the first add, when the size of the data is known.
+
+    def add(self, X, Y_class, Y_loc):
+        """ Add data to the current shard, writing it (and starting the next one) each time it fills.
+        Inputs:
+            X | n_data x ny x nx x n_channels | masked array of interferograms
+            Y_class | n_data x 3 | one hot encoding of dyke, sill, atmo
+            Y_loc | n_data x 4 | location of deformation
+        """
+        import numpy as np
+        import numpy.ma as ma
+
+        if self.X is None:                                                      # buffers are reused for every shard
+            X_dtype = 'float32' if self.shard_format == 'npy' else 'float64'
+            self.X = ma.zeros((self.n_data_per_file,) + X.shape[1:], dtype = X_dtype)
+            self.Y_class = np.zeros((self.n_data_per_file, Y_class.shape[1]))
+            self.Y_loc = np.zeros((self.n_data_per_file, Y_loc.shape[1]))
+
+        n_data = X.shape[0]
+        data_start = 0
+        while data_start < n_data:
+            n_add = min(n_data - data_start, self.n_data_per_file - self.data_n)           # either the rest of the data, or as many as fit in the shard.
+            self.X[self.data_n : self.data_n + n_add] = X[data_start : data_start + n_add]
+            self.Y_class[self.data_n : self.data_n + n_add] = Y_class[data_start : data_start + n_add]
+            self.Y_loc[self.data_n : self.data_n + n_add] = Y_loc[data_start : data_start + n_add]
+            self.data_n += n_add
+            data_start += n_add
+            if self.data_n == self.n_data_per_file:                                          # shard is full, so write it and carry on with the next one.
+                self.flush()
+
+    def flush(self):
+        """ Write whatever is in the buffer to a shard.
+        """
+        import numpy as np
+        import numpy.ma as ma
+        import pickle
+
+        if self.data_n == 0:
+            return
+        n = self.data_n
+        if self.shard_format == 'pkl':
+            shard_file = f"{self.outfile_stem}_{len(self.shards):05d}.pkl"
+            print(f"    Saving file {shard_file}")
+            with open(self.outdir / shard_file, 'wb') as f:                                    # save the output as a pickle
+                pickle.dump(self.X[:n], f)
+                pickle.dump(self.Y_class[:n], f)
+                pickle.dump(self.Y_loc[:n], f)
+        else:
+            shard_file = f"{self.outfile_stem}_{len(self.shards):05d}"                          # the stem of the four .npy files
+            print(f"    Saving file {shard_file}_*.npy")
+            np.save(self.outdir / f"{shard_file}_X.npy", ma.filled(self.X[:n], self.fill_value))
+            np.save(self.outdir / f"{shard_file}_mask.npy", np.packbits(ma.getmaskarray(self.X[:n]).reshape(n, -1), axis = 1))   # 8 pixels per byte, one row per datum
+            np.save(self.outdir / f"{shard_file}_Y_class.npy", self.Y_class[:n].astype('uint8'))
+            np.save(self.outdir / f"{shard_file}_Y_loc.npy", self.Y_loc[:n].astype('float32'))
+        self.shards.append({'file' : shard_file, 'n_data' : n})
+        self.data_n = 0
+
+    def close(self):
+        """ Write the final (partial) shard and the manifest.
+        Returns:
+            manifest | dict | see write_manifest
+        """
+        self.flush()
+        X_shape = list(self.X.shape[1:]) if self.X is not None else None
+        return write_manifest(self.outdir, self.outfile_stem, self.n_data_per_file, self.shards, self.shard_format, self.fill_value, X_shape)
+
+
+#%%
+
+def write_manifest(outdir, outfile_stem, n_data_per_file, shards, shard_format = 'pkl', fill_value = 0., X_shape = None):
+    """ Write a manifest (<outfile_stem>_manifest.json) describing a set of shards.
+
+    Inputs:
+        outdir | pathlib Path | directory the shards are in.
+        outfile_stem | string | stem of the shard names.
+        n_data_per_file | int | maximum number of data per shard.
+        shards | list of dicts | file name (file) and number of data (n_data) of each shard, in order.  For npy shards, file is the stem of the four .npy files.
+        shard_format | string | 'pkl' or 'npy'
+        fill_value | float | value of masked pixels in X for the npy format.
+        X_shape | list or None | shape of one datum (e.g. ny x nx x 1), needed to unpack the mask of npy shards.
+
+    Returns:
+        manifest | dict | contains n_data_per_file, n_data (total), format, fill_value, X_shape and shards.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+    import json
+    from pathlib import Path
+
+    manifest = {'n_data_per_file' : n_data_per_file,
+                'n_data'          : int(sum([shard['n_data'] for shard in shards])),
+                'format'          : shard_format,
+                'fill_value'      : float(fill_value),
+                'X_shape'         : X_shape,
+                'shards'          : shards}
+    with open(Path(outdir) / f"{outfile_stem}_manifest.json", 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    return manifest
+
+
+#%%
+
+class ShardDataset():
+    """ Random access to all the data in a set of shards, by global index (i.e. as if all the shards were one big array).
+    The shards are indexed once when the dataset is made, and data are then only read from the shards that contain them.
+    npy shards are memory mapped, so reading a datum (or a slice of data within one shard) doesn't copy X.  pkl shards have
+    to be unpickled in full, so the most recently used few are kept in memory.
+
+    Usage:
+        dataset = ShardDataset(outdir)
+        len(dataset)
+        X, Y_class, Y_loc = dataset[10]                 # one datum
+        X, Y_class, Y_loc = dataset[100:200]            # or a slice
+        X, Y_class, Y_loc = dataset[np.random.permutation(len(dataset))[:32]]          # or an array of indices, e.g. a shuffled batch
+
+    X is always returned as a masked array.
+
+    History:
+        2026_10_18 | MEG | Written.
+    """
+
+    def __init__(self, shard_dir, outfile_stem = 'data_file_unshuffled', n_cached_shards = 2):
+        """
+        Inputs:
+            shard_dir | pathlib Path | directory containing the shards.
+            outfile_stem | string | stem of the shards (and manifest).  If there is no manifest (e.g. shards from older versions), all the
+                                    shards that start with this are used.
+            n_cached_shards | int | number of pkl shards to keep in memory.
+        """
+        import numpy as np
+        import json
+        import glob
+        import pickle
+        from pathlib import Path
+
+        self.shard_dir = Path(shard_dir)
+        self.n_cached_shards = n_cached_shards
+        self.cache = {}                                                                 # shard number : (X, Y_class, Y_loc), for pkl shards
+        self.memmaps = {}                                                               # shard number : (X, mask, Y_class, Y_loc), for npy shards
+
+        manifest_file = self.shard_dir / f"{outfile_stem}_manifest.json"
+        if manifest_file.exists():
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+            self.shard_format = manifest['format']
+            self.X_shape = manifest['X_shape']
+            self.shards = manifest['shards']
+        else:                                                                           # no manifest, so find the shards and count the data in each.
+            npy_files = sorted(glob.glob(str(self.shard_dir / f"{outfile_stem}_*_X.npy")))
+            if len(npy_files) > 0:
+                self.shard_format = 'npy'
+                self.shards = []
+                for npy_file in npy_files:
+                    X = np.load(npy_file, mmap_mode = 'r')                              # only reads the header
+                    self.shards.append({'file' : Path(npy_file).name[:-6], 'n_data' : X.shape[0]})
+                    self.X_shape = list(X.shape[1:])
+            else:
+                self.shard_format = 'pkl'
+                self.shards = []
+                for pkl_file in sorted(glob.glob(str(self.shard_dir / f"{outfile_stem}_*.pkl"))):
+                    with open(pkl_file, 'rb') as f:
+                        X = pickle.load(f)
+                    self.shards.append({'file' : Path(pkl_file).name, 'n_data' : X.shape[0]})
+                    self.X_shape = list(X.shape[1:])
+            if len(self.shards) == 0:
+                raise Exception(f"No shards starting {outfile_stem} were found in {self.shard_dir}.  Exiting.  ")
+
+        self.shard_starts = np.concatenate((np.array([0]), np.cumsum([shard['n_data'] for shard in self.shards])))     # global index of the first datum in each shard, and the total at the end.
+
+    def __len__(self):
+        return int(self.shard_starts[-1])
+
+    def __getitem__(self, index):
+        """ Get data by global index.  index can be an int, a slice, or an array of ints.
+        Returns:
+            X | masked array | ny x nx x n_channels for an int, n x ny x nx x n_channels otherwise.
+            Y_class | 3 or n x 3 |
+            Y_loc | 4 or n x 4 |
+        """
+        import numpy as np
+        import numpy.ma as ma
+
+        if isinstance(index, (int, np.integer)):
+            shard_n, local_index = self.locate(index)
+            return self.read_shard(shard_n, int(local_index))
+
+        if isinstance(index, slice):
+            indices = np.arange(len(self))[index]
+            if (index.step in [None, 1]) and (indices.shape[0] > 0):
+                shard_n, local_start = self.locate(indices[0])
+                if (indices[-1] - self.shard_starts[shard_n]) < self.shards[shard_n]['n_data']:           # all in one shard, so can return views
+                    return self.read_shard(shard_n, slice(int(local_start), int(local_start) + indices.shape[0]))
+        else:
+            indices = np.asarray(index)
+
+        # general case, gather from each shard into new arrays.
+        shard_ns, local_indices = self.locate(indices)
+        X = None
+        for shard_n in np.unique(shard_ns):
+            positions = np.flatnonzero(shard_ns == shard_n)                                                # where these data go in the outputs
+            X_shard, Y_class_shard, Y_loc_shard = self.read_shard(shard_n, local_indices[positions])
+            if X is None:
+                X = ma.zeros((indices.shape[0],) + X_shard.shape[1:], dtype = X_shard.dtype)
+                Y_class = np.zeros((indices.shape[0],) + Y_class_shard.shape[1:], dtype = Y_class_shard.dtype)
+                Y_loc = np.zeros((indices.shape[0],) + Y_loc_shard.shape[1:], dtype = Y_loc_shard.dtype)
+            X[positions] = X_shard
+            Y_class[positions] = Y_class_shard
+            Y_loc[positions] = Y_loc_shard
+        if X is None:                                                                                        # no indices
+            X = ma.zeros([0] + self.X_shape)
+            Y_class = np.zeros((0, 3))
+            Y_loc = np.zeros((0, 4))
+        return X, Y_class, Y_loc
+
+    def locate(self, indices):
+        """ Convert global indices to shard numbers and indices within those shards.
+        """
+        import numpy as np
+
+        indices = np.asarray(indices)
+        indices = np.where(indices < 0, indices + len(self), indices)                                        # negative indices count from the end, as for arrays
+        if np.any(indices < 0) or np.any(indices >= len(self)):
+            raise IndexError(f"Index out of range for a ShardDataset of length {len(self)}")
+        shard_ns = np.searchsorted(self.shard_starts, indices, side = 'right') - 1
+        return shard_ns, indices - self.shard_starts[shard_ns]
+
+    def read_shard(self, shard_n, local_index):
+        """ Read data from one shard.  local_index can be an int, slice, or array of ints.
+        """
+        import numpy as np
+        import numpy.ma as ma
+        import pickle
+
+        shard_n = int(shard_n)
+        shard_file = self.shards[shard_n]['file']
+
+        if self.shard_format == 'npy':
+            if shard_n not in self.memmaps:
+                self.memmaps[shard_n] = tuple([np.load(self.shard_dir / f"{shard_file}_{array}.npy", mmap_mode = 'r') for array in ['X', 'mask', 'Y_class', 'Y_loc']])
+            X, mask_packed, Y_class, Y_loc = self.memmaps[shard_n]
+            mask = np.unpackbits(mask_packed[local_index], axis = -1, count = int(np.prod(self.X_shape))).astype(bool)
+            mask = mask.reshape(X[local_index].shape)
+            return ma.masked_array(X[local_index], mask = mask, copy = False), Y_class[local_index], Y_loc[local_index]
+
+        else:
+            if shard_n not in self.cache:
+                if len(self.cache) >= self.n_cached_shards:
+                    del self.cache[next(iter(self.cache))]                                                   # remove the least recently used shard
+                with open(self.shard_dir / shard_file, 'rb') as f:
+                    self.cache[shard_n] = (pickle.load(f), pickle.load(f), pickle.load(f))
+            self.cache[shard_n] = self.cache.pop(shard_n)                                                    # move to the end, as most recently used
+            X, Y_class, Y_loc = self.cache[shard_n]
+            return X[local_index], Y_class[local_index], Y_loc[local_index]
+
+
+#%%